@@ -1,9 +1,15 @@
 # ai.py
 
-import requests  # Use requests for synchronous HTTP calls
-import base64
+import asyncio
 import json
-from openai import OpenAI, APITimeoutError  # Use the synchronous OpenAI client
+import re
+import httpx
+from openai import AsyncOpenAI, APITimeoutError  # Async client, shares one keep-alive pool
+from openai.types.chat import ChatCompletionMessage
+from openai.types.chat.chat_completion_message_tool_call import (
+    ChatCompletionMessageToolCall,
+    Function,
+)
 from config import (
     API_KEY,
     BASE_URL,
@@ -12,15 +18,167 @@ from config import (
     LOVE_SYSTEM_PROMPT,
     AI_ANSWER_SYSTEM_PROMPT,
     SERPER_API_KEY,
+    LLM_TIMEOUT,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    SERPER_CACHE_SIZE,
+    TOOL_TIMEOUT,
     logger,
 )
+from cache import TTLCache
+from llm_scheduler import llm_scheduler
+from singleflight import SingleFlight, flight_key
+from usage import LLMCall, estimate_prompt_tokens
+from chunking import estimate_tokens
+from tracing import span
 
 # --- CLIENT INITIALIZATION ---
-client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+# One HTTP connection pool for every model call, so concurrent handlers reuse
+# warm keep-alive connections instead of paying a TLS handshake each time.
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+    ),
+    timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+)
+client = AsyncOpenAI(
+    api_key=API_KEY, base_url=BASE_URL, http_client=http_client, timeout=LLM_TIMEOUT
+)
+
+
+async def _create(**kwargs):
+    kwargs.setdefault("model", MODEL)
+    kwargs.setdefault("timeout", LLM_TIMEOUT)
+    return await client.chat.completions.create(**kwargs)
+
+
+async def create_chat_completion(**kwargs):
+    """
+    Awaitable wrapper around client.chat.completions.create with the per-call timeout applied.
+    Waits for a slot from llm_scheduler first; may raise LLMOverloaded for low-priority calls.
+    Every call is recorded to llm_calls with its token usage, timings and outcome.
+    """
+    call = LLMCall(kwargs.get("model", MODEL))
+    with span("llm.chat", model=call.model) as trace_span:
+        try:
+            async with llm_scheduler.slot():
+                call.admitted()
+                response = await _create(**kwargs)
+        except BaseException as e:
+            call.fail(e)
+            raise
+        usage = getattr(response, "usage", None)
+        call.finish(
+            usage.prompt_tokens if usage else None,
+            usage.completion_tokens if usage else None,
+        )
+        trace_span.set(queue_ms=call.queue_ms, tokens=usage.total_tokens if usage else None)
+    return response
+
+
+# Persistent keep-alive session for Serper, so repeat searches skip the TLS handshake
+serper_client = httpx.AsyncClient(
+    base_url="https://google.serper.dev",
+    headers={"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"},
+    timeout=10,
+)
+
+
+async def complete_chat(on_delta=None, **kwargs) -> ChatCompletionMessage:
+    """
+    Runs a chat completion and returns the assistant message.
+    With on_delta, the completion is streamed and on_delta(text_so_far) is awaited
+    after every content chunk; tool calls are reassembled from their deltas.
+    """
+    if on_delta is None:
+        response = await create_chat_completion(stream=False, **kwargs)
+        return response.choices[0].message
+
+    content = ""
+    tool_calls = {}
+    usage = None
+    call = LLMCall(kwargs.get("model", MODEL))
+    try:
+        # The slot is held until the stream is fully read
+        with span("llm.chat_stream", model=call.model) as trace_span:
+            async with llm_scheduler.slot():
+                call.admitted()
+                stream = await _create(stream=True, **kwargs)
+                async for chunk in stream:
+                    # Some providers send usage on the last chunk
+                    usage = getattr(chunk, "usage", None) or usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        content += delta.content
+                        await on_delta(content)
+                    for tool_call in delta.tool_calls or []:
+                        entry = tool_calls.setdefault(tool_call.index, {"id": "", "name": "", "arguments": ""})
+                        if tool_call.id:
+                            entry["id"] = tool_call.id
+                        if tool_call.function and tool_call.function.name:
+                            entry["name"] += tool_call.function.name
+                        if tool_call.function and tool_call.function.arguments:
+                            entry["arguments"] += tool_call.function.arguments
+                trace_span.set(queue_ms=call.queue_ms, chars=len(content))
+    except BaseException as e:
+        call.fail(e)
+        raise
+    if usage:
+        call.finish(usage.prompt_tokens, usage.completion_tokens)
+    else:
+        call.finish(
+            estimate_prompt_tokens(kwargs.get("messages", [])),
+            estimate_tokens(content) + sum(estimate_tokens(entry["arguments"]) for entry in tool_calls.values()),
+            estimated=True,
+        )
+
+    return ChatCompletionMessage(
+        role="assistant",
+        content=content or None,
+        tool_calls=[
+            ChatCompletionMessageToolCall(
+                id=entry["id"],
+                type="function",
+                function=Function(name=entry["name"], arguments=entry["arguments"]),
+            )
+            for _, entry in sorted(tool_calls.items())
+        ]
+        or None,
+    )
+
+
+async def close_ai_client() -> None:
+    """
+    Closes the shared HTTP connection pools. Call once on application shutdown.
+    """
+    await client.close()
+    await serper_client.aclose()
+    logger.info("AI client connection pool closed")
 
 
 # --- SERPER SEARCH FUNCTION ---
-def search_with_serper(query: str, time_range: str = "qdr:y") -> str:
+# Seconds a search result stays fresh, by time range: hourly news goes stale
+# fast, while a past-year search barely changes within a day
+SERPER_CACHE_TTL = {
+    "qdr:h": 5 * 60,
+    "qdr:d": 30 * 60,
+    "qdr:w": 3 * 60 * 60,
+    "qdr:m": 12 * 60 * 60,
+    "qdr:y": 24 * 60 * 60,
+}
+serper_cache = TTLCache(SERPER_CACHE_SIZE, SERPER_CACHE_TTL["qdr:d"])
+
+
+def _normalize_query(query: str) -> str:
+    """Case, spacing and trailing punctuation don't change what Google returns."""
+    query = re.sub(r"\s+", " ", (query or "").strip().lower())
+    return query.rstrip("?？!！。.,，")
+
+
+async def search_with_serper(query: str, time_range: str = "qdr:y") -> str:
     """
     Search for information using Serper.dev API.
 
@@ -36,10 +194,21 @@ def search_with_serper(query: str, time_range: str = "qdr:y") -> str:
     Returns:
         Formatted search results as a string
     """
+    cache_key = (_normalize_query(query), time_range)
+    cached = serper_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Serper cache hit: {query} (time_range: {time_range})")
+        return cached
+
+    with span("serper.search", query=query, time_range=time_range):
+        return await _search_with_serper(query, time_range, cache_key)
+
+
+async def _search_with_serper(query: str, time_range: str, cache_key) -> str:
+
     try:
         logger.info(f"Searching with Serper: {query} (time_range: {time_range})")
 
-        url = "https://google.serper.dev/search"
         payload = json.dumps(
             {
                 "q": query,
@@ -50,9 +219,7 @@ def search_with_serper(query: str, time_range: str = "qdr:y") -> str:
                 "tbs": time_range,  # Time-based search
             }
         )
-        headers = {"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"}
-
-        response = requests.post(url, headers=headers, data=payload, timeout=10)
+        response = await serper_client.post("/search", content=payload)
         response.raise_for_status()
 
         data = response.json()
@@ -77,15 +244,14 @@ def search_with_serper(query: str, time_range: str = "qdr:y") -> str:
             if kg_title and kg_desc:
                 search_results.insert(0, f"📚 知識圖譜: {kg_title}\n   {kg_desc}\n")
 
-        if search_results:
-            return "\n\n".join(search_results)
-        else:
-            return "搵唔到相關資料"
+        formatted = "\n\n".join(search_results) if search_results else "搵唔到相關資料"
+        serper_cache.set(cache_key, formatted, ttl=SERPER_CACHE_TTL.get(time_range))
+        return formatted
 
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.error("Serper API timeout")
         return "搜尋超時，請再試一次"
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Serper API error: {e}")
         return "搜尋出現問題，請再試一次"
     except Exception as e:
@@ -93,27 +259,24 @@ def search_with_serper(query: str, time_range: str = "qdr:y") -> str:
         return "搜尋系統出錯"
 
 
-# --- VISION FUNCTION (SYNCHRONOUS) ---
-def get_ai_vision_response(user_prompt: str, image_url: str, system_prompt: str) -> str:
+# --- VISION FUNCTION ---
+# Replies get_ai_vision_response gives in place of an answer
+VISION_EMPTY_REPLY = "AI 成功回應，但內容係空嘅，可能係安全設定擋咗。"
+VISION_TIMEOUT_REPLY = "AI諗太耐諗到瞓著咗，請再試一次"
+VISION_ERROR_REPLY = "系統分析唔到張圖，好對唔住"
+VISION_ERRORS = (VISION_EMPTY_REPLY, VISION_TIMEOUT_REPLY, VISION_ERROR_REPLY)
+
+
+async def get_ai_vision_response(user_prompt: str, image_url: str, system_prompt: str) -> str:
     """
-    Generates a response from the AI based on a text prompt and an image using synchronous calls.
+    Generates a response from the AI based on a text prompt and an image.
+    image_url is normally the data URL built by images.prepare_photo.
     Includes enhanced logging to inspect the full API response.
     """
     logger.info("Starting get_ai_vision_response function.")
     try:
-        logger.info(f"Downloading image from URL: {image_url}")
-        response = requests.get(image_url, timeout=15)
-        response.raise_for_status()
-        image_bytes = response.content
-        logger.info("Image downloaded successfully.")
-
-        logger.info("Encoding image to Base64.")
-        base64_image = base64.b64encode(image_bytes).decode("utf-8")
-        logger.info("Image encoded successfully.")
-
         logger.info("Calling OpenAI API for vision response.")
-        api_response = client.chat.completions.create(
-            model=MODEL,
+        api_response = await create_chat_completion(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {
@@ -122,9 +285,7 @@ def get_ai_vision_response(user_prompt: str, image_url: str, system_prompt: str)
                         {"type": "text", "text": user_prompt},
                         {
                             "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            },
+                            "image_url": {"url": image_url},
                         },
                     ],
                 },
@@ -143,17 +304,11 @@ def get_ai_vision_response(user_prompt: str, image_url: str, system_prompt: str)
         else:
             # This will now catch cases where the API returns 200 OK but an empty/filtered response.
             logger.error("API call was successful but returned no content/choices.")
-            return "AI 成功回應，但內容係空嘅，可能係安全設定擋咗。"
-
-    except requests.exceptions.Timeout:
-        logger.error("Timeout occurred while downloading image.")
-        return "下載圖片超時，張相可能太大或者網絡有問題"
-    except requests.exceptions.RequestException as http_err:
-        logger.error(f"HTTP error occurred while downloading image: {http_err}")
-        return "下載唔到張圖，請再試一次"
+            return VISION_EMPTY_REPLY
+
     except APITimeoutError:
         logger.error("OpenAI API call timed out.")
-        return "AI諗太耐諗到瞓著咗，請再試一次"
+        return VISION_TIMEOUT_REPLY
     except Exception as e:
         logger.error(f"An unexpected error occurred in get_ai_vision_response: {e}")
         # Log the actual API response object if an error occurs during parsing
@@ -161,7 +316,7 @@ def get_ai_vision_response(user_prompt: str, image_url: str, system_prompt: str)
             logger.error(
                 f"API response at time of error: {locals().get('api_response')}"
             )
-        return "系統分析唔到張圖，好對唔住"
+        return VISION_ERROR_REPLY
 
 
 # --- FUNCTION TOOLS DEFINITION ---
@@ -215,8 +370,58 @@ SEARCH_TOOL = {
 }
 
 
-# --- TEXT-ONLY FUNCTIONS (SYNCHRONOUS) ---
-def get_ai_answer_with_tools(user_prompt: str, max_iterations: int = 3) -> str:
+# --- TOOL REGISTRY ---
+# Tool name -> schema offered to the model, async handler taking the parsed
+# arguments dict, and per-call timeout in seconds
+TOOL_REGISTRY = {}
+
+
+def register_tool(schema: dict, handler, timeout: float = TOOL_TIMEOUT) -> None:
+    TOOL_REGISTRY[schema["function"]["name"]] = {
+        "schema": schema,
+        "handler": handler,
+        "timeout": timeout,
+    }
+
+
+async def _search_tool(args: dict) -> str:
+    return await search_with_serper(args.get("query"), args.get("time_range", "qdr:y"))
+
+
+register_tool(SEARCH_TOOL, _search_tool)
+
+
+async def run_tool_call(tool_call) -> dict:
+    """
+    Executes one tool call from the model and returns the tool message for it.
+    Failures are reported back to the model as the tool's content.
+    """
+    function_name = tool_call.function.name
+    tool = TOOL_REGISTRY.get(function_name)
+    try:
+        function_args = json.loads(tool_call.function.arguments or "{}")
+        logger.info(f"Calling {function_name} with args: {function_args}")
+        if tool is None:
+            content = f"冇呢個工具: {function_name}"
+        else:
+            with span(f"tool.{function_name}"):
+                content = await asyncio.wait_for(tool["handler"](function_args), tool["timeout"])
+    except asyncio.TimeoutError:
+        logger.error(f"Tool {function_name} timed out")
+        content = "工具執行超時"
+    except Exception as e:
+        logger.error(f"Tool {function_name} failed: {e}")
+        content = "工具執行出錯"
+    return {
+        "tool_call_id": tool_call.id,
+        "role": "tool",
+        "name": function_name,
+        "content": content,
+    }
+
+
+# --- TEXT-ONLY FUNCTIONS ---
+async def get_ai_answer_with_tools(user_prompt: str, max_iterations: int = 3, on_delta=None) -> str:
     """
     Generates a text-based answer from the AI with tool calling capability.
     AI can decide whether to search for information using Serper.
@@ -225,6 +430,7 @@ def get_ai_answer_with_tools(user_prompt: str, max_iterations: int = 3) -> str:
     Args:
         user_prompt: The user's question
         max_iterations: Maximum number of tool calling iterations (default: 3)
+        on_delta: Optional coroutine called with the answer so far while it streams
     """
     try:
         logger.info(f"Starting get_ai_answer_with_tools for prompt: {user_prompt}")
@@ -240,15 +446,13 @@ def get_ai_answer_with_tools(user_prompt: str, max_iterations: int = 3) -> str:
             logger.info(f"Tool calling iteration {iteration}/{max_iterations}")
 
             # Call AI - may decide to use tools
-            response = client.chat.completions.create(
-                model=MODEL,
-                messages=messages,
-                tools=[SEARCH_TOOL],
-                tool_choice="auto",  # Let AI decide
-                stream=False,
-            )
-
-            response_message = response.choices[0].message
+            with span("ask.iteration", iteration=iteration):
+                response_message = await complete_chat(
+                    on_delta=on_delta,
+                    messages=messages,
+                    tools=[tool["schema"] for tool in TOOL_REGISTRY.values()],
+                    tool_choice="auto",  # Let AI decide
+                )
             tool_calls = response_message.tool_calls
 
             # If AI wants to use tools
@@ -260,29 +464,10 @@ def get_ai_answer_with_tools(user_prompt: str, max_iterations: int = 3) -> str:
                 # Add AI's response to messages
                 messages.append(response_message)
 
-                # Execute each tool call
-                for tool_call in tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-
-                    logger.info(f"Calling {function_name} with args: {function_args}")
-
-                    if function_name == "search_with_serper":
-                        query = function_args.get("query")
-                        time_range = function_args.get("time_range", "qdr:y")
-
-                        # Call the search function
-                        search_results = search_with_serper(query, time_range)
-
-                        # Add function result to messages
-                        messages.append(
-                            {
-                                "tool_call_id": tool_call.id,
-                                "role": "tool",
-                                "name": function_name,
-                                "content": search_results,
-                            }
-                        )
+                # Execute the tool calls concurrently; results keep the calls' order
+                messages.extend(
+                    await asyncio.gather(*(run_tool_call(tool_call) for tool_call in tool_calls))
+                )
 
                 # Continue loop - AI will process results and may call tools again
                 continue
@@ -305,7 +490,7 @@ def get_ai_answer_with_tools(user_prompt: str, max_iterations: int = 3) -> str:
         return "系統想方加(出錯)，好對唔住"
 
 
-def get_ai_answer(user_prompt: str, search_results: str = None) -> str:
+async def get_ai_answer(user_prompt: str, search_results: str = None) -> str:
     """
     Generates a text-based answer from the AI.
     If search_results are provided, they will be included in the prompt.
@@ -332,8 +517,7 @@ def get_ai_answer(user_prompt: str, search_results: str = None) -> str:
         else:
             enhanced_prompt = user_prompt
 
-        response = client.chat.completions.create(
-            model=MODEL,
+        response = await create_chat_completion(
             messages=[
                 {"role": "system", "content": AI_ANSWER_SYSTEM_PROMPT},
                 {"role": "user", "content": enhanced_prompt},
@@ -346,37 +530,44 @@ def get_ai_answer(user_prompt: str, search_results: str = None) -> str:
         return "系統想方加(出錯)，好對唔住"
 
 
-def get_ai_summary(user_prompt: str, system_prompt="") -> str:
+# Identical summary prompts running at the same time share one model call
+summary_flights = SingleFlight()
+
+
+async def get_ai_summary(user_prompt: str, system_prompt="", on_delta=None) -> str:
     """
     Generates a text-based summary or response from the AI.
+    With on_delta, the response is streamed and on_delta(text_so_far) is awaited as it grows.
+    Concurrent calls with the same prompts await a single model call.
     """
+    system_prompt = system_prompt if system_prompt else AI_GENERATE_BASE_PROMPT
+    key = flight_key(MODEL, system_prompt, user_prompt)
+    return await summary_flights.run(
+        key, lambda fan_out: _get_ai_summary(user_prompt, system_prompt, fan_out), on_delta
+    )
+
+
+async def _get_ai_summary(user_prompt: str, system_prompt: str, on_delta) -> str:
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
+        response_message = await complete_chat(
+            on_delta=on_delta,
             messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        system_prompt if system_prompt else AI_GENERATE_BASE_PROMPT
-                    ),
-                },
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            stream=False,
         )
-        return response.choices[0].message.content
+        return response_message.content
     except Exception as e:
         print(f"Error in get_ai_summary: {e}")
         return "系統想方加(出錯)，好對唔住"
 
 
-def get_ai_apology() -> str:
+async def get_ai_apology() -> str:
     """
     Generates a humorous apology.
     """
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
+        response = await create_chat_completion(
             messages=[
                 {
                     "role": "user",
@@ -393,13 +584,12 @@ def get_ai_apology() -> str:
         return "哎呀，道歉失敗，唔好打我🙏"
 
 
-def get_ai_love_quote(username: str, user_messages: str) -> str:
+async def get_ai_love_quote(username: str, user_messages: str) -> str:
     """
     Generates a cheesy love quote.
     """
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
+        response = await create_chat_completion(
             messages=[
                 {"role": "system", "content": LOVE_SYSTEM_PROMPT},
                 {
@@ -417,13 +607,12 @@ def get_ai_love_quote(username: str, user_messages: str) -> str:
         return "哎呀，情話生成失敗，愛你唔使講😜"
 
 
-def get_ai_countdown(user_prompt="") -> str:
+async def get_ai_countdown(user_prompt="") -> str:
     """
     Generates a creative countdown message.
     """
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
+        response = await create_chat_completion(
             messages=[
                 {"role": "system", "content": AI_GENERATE_BASE_PROMPT},
                 {
@@ -4,10 +4,14 @@ from datetime import datetime, timedelta
 from config import HK_TIMEZONE, logger, AI_CHAT_SYSTEM_PROMPT, AI_GENERATE_BASE_PROMPT
 from db import DatabaseOperations
 from ai import get_ai_summary
+from streaming import StreamingReply
+from transcript import compact_rows
+from llm_scheduler import llm_priority, Priority
 
-from database import log_message, log_bot_reply, check_daily_usage_limit, increment_daily_usage
+from database import log_message, log_bot_reply, reserve_daily_usage, refund_daily_usage
 
 
+@llm_priority(Priority.HIGH)
 async def handle_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handles AI chat functionality in group chats when the bot is mentioned or replied to.
@@ -29,68 +33,76 @@ async def handle_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     if not (is_reply_to_bot or is_mentioning_bot):
         return
     
-    # Check daily usage limit (20 times per day per group)
-    can_use, current_usage = check_daily_usage_limit(message.chat_id, max_usage=20)
-    if not can_use:
+    # Reserve one use of the daily limit (20 times per day per group); refunded unless an answer is sent
+    reserved, remaining_usage = await reserve_daily_usage(message.chat_id, max_usage=20)
+    if not reserved:
         await message.reply_text(
-            f"今日已經用咗 {current_usage} 次喇 Ching！😅 聽日再搵我傾偈啦～",
+            "今日已經用咗 20 次喇 Ching！😅 聽日再搵我傾偈啦～",
             reply_to_message_id=message.message_id
         )
         return
     
-    logger.info(f"Bot is mentioned or replied to in chat {message.chat_id}. Triggering AI response.")
+    delivered = False
+    try:
+        logger.info(f"Bot is mentioned or replied to in chat {message.chat_id}. Triggering AI response.")
 
-    now = datetime.now(HK_TIMEZONE)
-    one_hour_ago = now - timedelta(hours=1)
+        now = datetime.now(HK_TIMEZONE)
+        one_hour_ago = now - timedelta(hours=1)
 
-    db_ops = DatabaseOperations()
-    rows = db_ops.get_messages_in_range(message.chat_id, one_hour_ago, now)
+        db_ops = DatabaseOperations()
+        rows = await db_ops.get_messages_in_range(message.chat_id, one_hour_ago, now)
 
-    if rows is None:
-        await message.reply_text("哎呀，讀取對話紀錄時出錯！🤯")
-        return
+        if rows is None:
+            await message.reply_text("哎呀，讀取對話紀錄時出錯！🤯")
+            return
 
-    #  Format chat history
-    chat_history = "\n".join([f"{row[0]}: {row[1]}" for row in rows])
+        #  Format chat history, compacted; the bot's own earlier replies are cut short
+        transcript = compact_rows(rows, bot_name=bot.name, label=f"chat {message.chat_id}")
+        chat_history = transcript.text
 
-    # Prepare the prompt for AI
-    user_prompt = f"""
-    # 對話紀錄 (過去一小時)
-    ---
-    {chat_history if chat_history else "（最近一個鐘冇人講過嘢）"}
-    ---
+        # Prepare the prompt for AI
+        user_prompt = f"""
+        # 對話紀錄 (過去一小時)
+        ---
+        {chat_history if chat_history else "（最近一個鐘冇人講過嘢）"}
+        ---
 
-    # 用戶最新嘅訊息
-    {message.from_user.first_name}: "{message.text}"
-    """
+        # 用戶最新嘅訊息
+        {message.from_user.first_name}: "{message.text}"
+        """
 
-    system_prompt = f"""
-    {AI_CHAT_SYSTEM_PROMPT}
-    """
+        system_prompt = f"""
+        {AI_CHAT_SYSTEM_PROMPT}
+        """
 
-    waiting_message = await message.reply_text("諗緊點答… ⏳", reply_to_message_id=message.message_id)
+        waiting_message = await message.reply_text("諗緊點答… ⏳", reply_to_message_id=message.message_id)
 
-    ai_response = get_ai_summary(user_prompt, system_prompt)
+        reply = StreamingReply(waiting_message)
 
-    if ai_response and '系統' not in ai_response:
-        # Increment daily usage count first
-        increment_daily_usage(message.chat_id)
-        
-        # Get updated usage count for display
-        _, updated_usage = check_daily_usage_limit(message.chat_id, max_usage=20)
-        remaining_usage = 20 - updated_usage
-        
-        # Add usage info to the response
-        response_with_usage = f"{ai_response}\n\n💬 今日剩餘用量：{remaining_usage}/20"
+        async def on_delta(text):
+            await reply.update(transcript.expand(text))
+
+        ai_response = transcript.expand(await get_ai_summary(user_prompt, system_prompt, on_delta=on_delta))
+
+        if ai_response and '系統' not in ai_response:
+            # Add usage info to the response
+            remaining = "未知" if remaining_usage is None else f"{remaining_usage}/20"
+            response_with_usage = f"{ai_response}\n\n💬 今日剩餘用量：{remaining}"
         
-        sent_message = await waiting_message.edit_text(response_with_usage)
-
-        await log_bot_reply(
-            chat_id=sent_message.chat_id,
-            chat_title=sent_message.chat.title if sent_message.chat.title else "Private Chat",
-            text=sent_message.text,
-            bot_id=bot.id,
-            bot_name=bot.name
-        )
-    else:
-        await waiting_message.edit_text('系統諗到hang咗機，一陣再試過啦！😵')
+            sent_message = await reply.finish(response_with_usage)
+            delivered = True
+
+            await log_bot_reply(
+                chat_id=sent_message.chat_id,
+                chat_title=sent_message.chat.title if sent_message.chat.title else "Private Chat",
+                text=response_with_usage,
+                bot_id=bot.id,
+                bot_name=bot.name
+            )
+        else:
+            await reply.finish('系統諗到hang咗機，一陣再試過啦！😵')
+    finally:
+        # Whatever stops the answer, including an error or cancellation, gives the use back.
+        # A use the database never counted (remaining_usage is None) has nothing to refund.
+        if not delivered and remaining_usage is not None:
+            await refund_daily_usage(message.chat_id)
@@ -1,12 +1,14 @@
 from ai import get_ai_apology
+from llm_scheduler import llm_priority, Priority
 
 
+@llm_priority(Priority.LOW)
 async def apologize(update, context):
     chat_id = update.message.chat_id
     print(f"Starting apology generation for chat {chat_id}")
 
     waiting_message = await update.message.reply_text("度緊呢單野點拆… ⏳")
-    apology = get_ai_apology()
+    apology = await get_ai_apology()
     print(f"Generated apology for chat {chat_id}: {apology}")
 
     if apology and apology != '哎呀，道歉失敗，唔好打我🙏':
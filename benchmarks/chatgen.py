@@ -0,0 +1,79 @@
+"""
+Synthetic Cantonese group chats for the benchmarks.
+
+Rows have the messages table layout, (chat_id, user_name, user_id, text,
+timestamp, chat_title), with HK timestamps. Output is deterministic for a
+given seed.
+"""
+import random
+from datetime import date, datetime, timedelta
+from config import HK_TIMEZONE
+
+NAMES = [
+    "陳大文", "阿明", "肥仔", "小薇", "Kelvin", "Ken仔", "豬扒", "Mandy", "阿強", "Jason Wong",
+    "細佬", "Ivy", "阿詩", "大隻佬", "Peter Chan", "Carmen", "阿輝", "阿珊", "老細", "Tommy",
+]
+OPENERS = ["喂", "哈哈哈", "真係", "講真", "唔係掛", "頂", "吓", "好似", "其實", "笑死"]
+PHRASES = [
+    "今晚食咩好", "又加班呀", "啲樓價又跌咗", "呢個 deadline 死梗", "聽日打唔打波",
+    "巴士又遲到", "成日落雨好煩", "你哋睇咗新聞未", "老細又發癲", "我想放假",
+    "隔籬間茶記好好食", "有冇人去行山", "股票又輸錢", "部電話又壞咗", "今日好攰",
+    "去唔去飲嘢", "個game又更新", "啲外賣好貴", "返工等放工", "屋企部冷氣壞咗",
+]
+CLOSERS = ["😂", "🤣", "😅", "👍", "on9", "lol", "…", "!!", "?", ""]
+LINKS = ["https://lihkg.com/thread/3456789/page/1", "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+         "https://news.rthk.hk/rthk/ch/component/k2/1700000-20240101.htm"]
+
+# Relative activity per HK hour: quiet overnight, busiest in the evening
+HOUR_WEIGHTS = [2, 1, 1, 0.5, 0.5, 0.5, 1, 3, 5, 6, 6, 6, 8, 7, 6, 6, 6, 7, 9, 10, 10, 9, 7, 4]
+
+
+class ChatGenerator:
+    def __init__(self, chats: int = 20, users: int = 30, messages_per_day: int = 500, seed: int = 0):
+        self.chats = chats
+        self.messages_per_day = messages_per_day
+        self.seed = seed
+        rng = random.Random(seed)
+        self.chat_ids = [-1001000000000 - i for i in range(chats)]
+        self.titles = {chat_id: f"吹水群 {i + 1}" for i, chat_id in enumerate(self.chat_ids)}
+        # Each chat gets its own members; a few of them do most of the talking
+        self.members = {}
+        for chat_id in self.chat_ids:
+            ids = rng.sample(range(100000, 100000 + users * 10), users)
+            members = [(user_id, _name(user_id)) for user_id in ids]
+            self.members[chat_id] = (members, [1 / (rank + 1) for rank in range(users)])
+
+    def text(self, rng: random.Random) -> str:
+        parts = [rng.choice(PHRASES) for _ in range(rng.choice((1, 1, 1, 2, 3)))]
+        if rng.random() < 0.4:
+            parts.insert(0, rng.choice(OPENERS))
+        if rng.random() < 0.03:
+            parts.append(rng.choice(LINKS))
+        return " ".join(parts) + rng.choice(CLOSERS)
+
+    def day(self, day: date) -> list:
+        """Every chat's messages for one day, oldest first."""
+        rng = random.Random(f"{self.seed}:{day.isoformat()}")
+        midnight = datetime(day.year, day.month, day.day, tzinfo=HK_TIMEZONE)
+        rows = []
+        for chat_id in self.chat_ids:
+            members, weights = self.members[chat_id]
+            hours = rng.choices(range(24), HOUR_WEIGHTS, k=self.messages_per_day)
+            speakers = rng.choices(members, weights, k=self.messages_per_day)
+            for hour, (user_id, user_name) in zip(hours, speakers):
+                timestamp = midnight + timedelta(hours=hour, seconds=rng.randrange(3600))
+                rows.append((chat_id, user_name, user_id, self.text(rng), timestamp, self.titles[chat_id]))
+        rows.sort(key=lambda row: row[4])
+        return rows
+
+    def days_back(self, last_day: date):
+        """Yields (day, rows) from last_day backwards, without end."""
+        day = last_day
+        while True:
+            yield day, self.day(day)
+            day -= timedelta(days=1)
+
+
+def _name(user_id: int) -> str:
+    name = NAMES[user_id % len(NAMES)]
+    return name if user_id % 3 else f"{name}{user_id % 100}"
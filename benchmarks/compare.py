@@ -0,0 +1,42 @@
+"""
+Side-by-side view of two benchmark result files.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import json
+
+
+def flatten(value, prefix=""):
+    """Maps "suite.case.metric" paths to every numeric leaf of a results tree."""
+    if isinstance(value, dict):
+        items = {}
+        for key, child in value.items():
+            items.update(flatten(child, f"{prefix}.{key}" if prefix else key))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+
+    records = []
+    for path in (args.old, args.new):
+        with open(path, encoding="utf-8") as source:
+            records.append(json.load(source))
+    old, new = (flatten(record["results"]) for record in records)
+
+    print(f"{'metric':<52} {records[0]['git_commit'] or 'old':>12} {records[1]['git_commit'] or 'new':>12} {'change':>9}")
+    for key in sorted(old.keys() | new.keys()):
+        before, after = old.get(key), new.get(key)
+        change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else ""
+        print(f"{key:<52} {'' if before is None else before:>12} {'' if after is None else after:>12} {change:>9}")
+
+
+if __name__ == "__main__":
+    main()
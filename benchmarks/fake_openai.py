@@ -0,0 +1,129 @@
+"""
+OpenAI-compatible /v1/chat/completions stand-in with injectable latency,
+plus a Serper-shaped /search.
+
+Non-streamed calls answer after `latency` seconds. Streamed calls send the
+first chunk after `latency` seconds and the rest `chunk_interval` apart.
+With tool_calls set, a request offering tools that has no tool result yet is
+answered with a search_with_serper call, so the /ask tool loop runs end to
+end. Runs on a background thread, so it works next to any event loop.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = "大家今日主要傾咗食飯、返工同埋樓價，氣氛輕鬆，笑位唔少 😂"
+SEARCH_RESULTS = {
+    "organic": [
+        {"title": f"搜尋結果 {i}", "link": f"https://example.com/{i}", "snippet": "呢度係一段測試用嘅摘要。"}
+        for i in range(1, 6)
+    ]
+}
+TOOL_CALL = {
+    "index": 0, "id": "call_bench", "type": "function",
+    "function": {"name": "search_with_serper", "arguments": json.dumps({"query": "香港 新聞", "time_range": "qdr:d"})},
+}
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.5, chunk_interval: float = 0.02, chunks: int = 10,
+                 tool_calls: bool = False, search_latency: float = 0.3, port: int = 0):
+        self.latency = latency
+        self.search_latency = search_latency
+        self.tool_calls = tool_calls
+        self.chunk_interval = chunk_interval
+        self.chunks = chunks
+        self.requests = 0
+        self.searches = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def root(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def url(self) -> str:
+        return f"{self.root}/v1"
+
+    def start(self) -> "FakeOpenAI":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.endswith("/search"):
+                    fake.searches += 1
+                    time.sleep(fake.search_latency)
+                    self._json(SEARCH_RESULTS)
+                    return
+                fake.requests += 1
+                time.sleep(fake.latency)
+                call_tool = (
+                    fake.tool_calls and body.get("tools")
+                    and not any(message.get("role") == "tool" for message in body.get("messages", []))
+                )
+                if body.get("stream"):
+                    self._stream(body, call_tool)
+                    return
+                # About one prompt token per three bytes of request, close enough for accounting
+                prompt_tokens = int(self.headers.get("Content-Length", 0)) // 3
+                message = {"role": "assistant", "content": None if call_tool else REPLY}
+                if call_tool:
+                    message["tool_calls"] = [{key: value for key, value in TOOL_CALL.items() if key != "index"}]
+                self._json({
+                    "id": "bench", "object": "chat.completion", "created": int(time.time()),
+                    "model": body.get("model", "bench"),
+                    "choices": [{"index": 0, "finish_reason": "tool_calls" if call_tool else "stop",
+                                 "message": message}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(REPLY),
+                              "total_tokens": prompt_tokens + len(REPLY)},
+                })
+
+            def _json(self, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, call_tool):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                if call_tool:
+                    deltas = [{"tool_calls": [TOOL_CALL]}]
+                else:
+                    step = max(1, len(REPLY) // fake.chunks)
+                    deltas = [{"content": REPLY[i:i + step]} for i in range(0, len(REPLY), step)]
+                for delta in deltas:
+                    chunk = {
+                        "id": "bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": body.get("model", "bench"),
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(fake.chunk_interval)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
@@ -0,0 +1,49 @@
+"""
+Local Postgres for the benchmarks.
+
+With BENCH_DATABASE_URL set, that database is used as is. Its messages,
+hourly_summaries and llm_calls tables are emptied, so point it at a
+dedicated database. Otherwise a throwaway cluster is created in a temporary
+directory with initdb/pg_ctl from PATH and removed afterwards. initdb refuses
+to run as root.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_postgres():
+    """Yields the URL of a benchmark database."""
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if url:
+        yield url
+        return
+    if not shutil.which("initdb") or not shutil.which("pg_ctl"):
+        raise RuntimeError("initdb/pg_ctl not found on PATH; install Postgres or set BENCH_DATABASE_URL")
+
+    data_dir = tempfile.mkdtemp(prefix="bench-pg-")
+    port = _free_port()
+    subprocess.run(
+        ["initdb", "-D", data_dir, "-U", "bench", "--auth=trust", "-E", "UTF8", "--no-locale"],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    options = f"-p {port} -c listen_addresses=127.0.0.1 -c unix_socket_directories={data_dir}"
+    subprocess.run(
+        ["pg_ctl", "-D", data_dir, "-o", options, "-l", os.path.join(data_dir, "server.log"), "-w", "start"],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    try:
+        yield f"postgresql://bench@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run(["pg_ctl", "-D", data_dir, "-m", "fast", "-w", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,276 @@
+"""
+Load harness: replays a stream of Telegram updates into the bot's real
+Application (main.build_application, every handler registered) and measures
+how it keeps up.
+
+    python -m benchmarks.replay [--updates 2000] [--concurrency 64] [--rate 0]
+    python -m benchmarks.replay --file recorded.jsonl --bot-username my_bot
+
+The Bot API is benchmarks/telegram_stub.py, the model and Serper are
+benchmarks/fake_openai.py, and Postgres comes from benchmarks/postgres.py.
+Nothing reaches Telegram or a paid API.
+
+Updates come from --file (one Bot API Update object per line, as returned by
+getUpdates) or are generated: chat messages across chats of very different
+activity, with mentions and commands mixed in per --mix. At most
+--concurrency updates are in flight at once; --rate additionally caps how
+many are offered per second.
+
+Reported: sustained updates/s, end-to-end latency per update kind (enqueue to
+last handler done), time spent queued before the first handler, event-loop
+lag, and Bot API / model / search call counts.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.postgres import local_postgres
+from benchmarks.run import configure_bot, percentiles, save_results
+from benchmarks.telegram_stub import BOT_ID, StubBotRequest
+
+DEFAULT_MIX = (
+    "message=85,mention=4,summarize=2,ask=2,golden_quote_king=1,love=1,compliment=1,diu=1,"
+    "apologize=1,countdown=1,stats=1"
+)
+COMMAND_ARGS = {"ask": "香港今日有咩新聞", "apologize": "阿明"}
+# Commands that act on the message they reply to
+REPLY_COMMANDS = {"love", "compliment", "diu", "summarize_user"}
+PHOTO_COMMANDS = {"diu"}
+
+
+class UpdateFactory:
+    """Builds Bot API update payloads from ChatGenerator chats. Busier chats get more of the traffic."""
+
+    def __init__(self, generator, mix: dict, bot_username: str, seed: int = 0):
+        self.generator = generator
+        self.kinds, self.weights = zip(*mix.items())
+        self.bot_username = bot_username
+        self.rng = random.Random(seed)
+        self.chat_weights = [1 / (rank + 1) for rank in range(len(generator.chat_ids))]
+        self.update_ids = 0
+        self.message_ids = 0
+
+    def _message(self, chat_id, user, text=None, **extra):
+        self.message_ids += 1
+        message = {
+            "message_id": self.message_ids,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": self.generator.titles[chat_id]},
+            "from": {"id": user[0], "is_bot": False, "first_name": user[1]},
+        }
+        if text is not None:
+            message["text"] = text
+        message.update(extra)
+        return message
+
+    def next(self) -> dict:
+        rng = self.rng
+        chat_id = rng.choices(self.generator.chat_ids, self.chat_weights)[0]
+        members, weights = self.generator.members[chat_id]
+        user = rng.choices(members, weights)[0]
+        kind = rng.choices(self.kinds, self.weights)[0]
+        text = self.generator.text(rng)
+
+        if kind == "message":
+            message = self._message(chat_id, user, text)
+        elif kind == "mention":
+            message = self._message(chat_id, user, f"@{self.bot_username} {text}")
+        else:
+            command = f"/{kind}"
+            args = COMMAND_ARGS.get(kind)
+            extra = {}
+            if kind in REPLY_COMMANDS:
+                target = rng.choice(members)
+                if kind in PHOTO_COMMANDS:
+                    # A small pool of photos, so repeats exercise the image caches
+                    photo_id = self.message_ids % 50
+                    photo = [{"file_id": f"photo{photo_id}", "file_unique_id": f"p{photo_id}",
+                              "width": 1280, "height": 960, "file_size": 120000}]
+                    extra["reply_to_message"] = self._message(chat_id, target, photo=photo)
+                else:
+                    extra["reply_to_message"] = self._message(chat_id, target, text)
+            message = self._message(
+                chat_id, user, f"{command} {args}" if args else command,
+                entities=[{"type": "bot_command", "offset": 0, "length": len(command)}], **extra,
+            )
+        self.update_ids += 1
+        return {"update_id": self.update_ids, "message": message}
+
+
+def update_kind(payload: dict, bot_username: str) -> str:
+    message = payload.get("message") or payload.get("edited_message") or {}
+    text = message.get("text") or ""
+    if text.startswith("/"):
+        return text.split()[0][1:].split("@")[0]
+    if f"@{bot_username}" in text:
+        return "mention"
+    reply = message.get("reply_to_message") or {}
+    if (reply.get("from") or {}).get("id") == BOT_ID:
+        return "mention"
+    return "message" if text else "other"
+
+
+class Tracker:
+    """Timestamps each update as it is enqueued, reaches its first handler and leaves its last one."""
+
+    def __init__(self, concurrency: int):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.enqueued = {}
+        self.kinds = {}
+        self.queued = defaultdict(list)
+        self.latency = defaultdict(list)
+        self.errors = 0
+        self.first_enqueued = None
+        self.last_finished = None
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def enqueue(self, application, update, kind: str):
+        await self.slots.acquire()
+        now = time.perf_counter()
+        self.first_enqueued = self.first_enqueued or now
+        self.enqueued[update.update_id] = now
+        self.kinds[update.update_id] = kind
+        self.idle.clear()
+        await application.update_queue.put(update)
+
+    async def started(self, update, context):
+        if update.update_id in self.enqueued:
+            self.queued[self.kinds[update.update_id]].append(time.perf_counter() - self.enqueued[update.update_id])
+
+    async def finished(self, update, context):
+        enqueued = self.enqueued.pop(update.update_id, None)
+        if enqueued is None:
+            return
+        self.last_finished = time.perf_counter()
+        self.latency[self.kinds.pop(update.update_id)].append(self.last_finished - enqueued)
+        self.slots.release()
+        if not self.enqueued:
+            self.idle.set()
+
+    async def error(self, update, context):
+        self.errors += 1
+
+
+async def watch_loop_lag(samples: list, interval: float = 0.05):
+    """Records how late the event loop wakes up from a fixed sleep."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+def load_updates(args, generator) -> list:
+    if args.file:
+        with open(args.file, encoding="utf-8") as source:
+            return [json.loads(line) for line in source if line.strip()]
+    mix = {}
+    for item in args.mix.split(","):
+        kind, weight = item.split("=")
+        mix[kind.strip()] = float(weight)
+    factory = UpdateFactory(generator, mix, args.bot_username, args.seed)
+    return [factory.next() for _ in range(args.updates)]
+
+
+async def replay(args, fake_llm) -> dict:
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    import ai
+    from benchmarks.chatgen import ChatGenerator
+    from llm_scheduler import llm_scheduler
+    from main import build_application
+
+    # Serper requests go to the fake server's /search
+    ai.serper_client.base_url = fake_llm.root
+    generator = ChatGenerator(args.chats, args.users, seed=args.seed)
+    payloads = load_updates(args, generator)
+
+    stub = StubBotRequest(latency=args.telegram_latency, bot_username=args.bot_username)
+    application = build_application(request=stub)
+    tracker = Tracker(args.concurrency)
+    application.add_handler(TypeHandler(Update, tracker.started), group=-1)
+    application.add_handler(TypeHandler(Update, tracker.finished), group=99)
+    application.add_error_handler(tracker.error)
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    loop_lag = []
+    lag_task = asyncio.create_task(watch_loop_lag(loop_lag))
+    try:
+        interval = 1 / args.rate if args.rate else 0
+        offered_from = time.perf_counter()
+        for index, payload in enumerate(payloads):
+            if interval:
+                delay = offered_from + index * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = Update.de_json(payload, application.bot)
+            await tracker.enqueue(application, update, update_kind(payload, args.bot_username))
+        try:
+            await asyncio.wait_for(tracker.idle.wait(), args.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"{len(tracker.enqueued)} update(s) still unfinished after {args.drain_timeout}s")
+    finally:
+        lag_task.cancel()
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+
+    completed = sum(len(samples) for samples in tracker.latency.values())
+    elapsed = (tracker.last_finished or time.perf_counter()) - (tracker.first_enqueued or time.perf_counter())
+    all_latency = [sample for samples in tracker.latency.values() for sample in samples]
+    return {
+        "updates": len(payloads),
+        "completed": completed,
+        "unfinished": len(tracker.enqueued),
+        "handler_errors": tracker.errors,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(completed / elapsed, 1) if elapsed > 0 else None,
+        "latency": percentiles(all_latency),
+        "latency_by_kind": {kind: percentiles(samples) for kind, samples in sorted(tracker.latency.items())},
+        "queued_by_kind": {kind: percentiles(samples) for kind, samples in sorted(tracker.queued.items())},
+        "event_loop_lag": percentiles(loop_lag),
+        "bot_api_calls": dict(stub.calls),
+        "model_calls": fake_llm.requests,
+        "searches": fake_llm.searches,
+        "llm_scheduler": llm_scheduler.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Telegram updates into the bot against local stand-ins.")
+    parser.add_argument("--file", help="JSONL of recorded Bot API updates (default: synthetic stream)")
+    parser.add_argument("--updates", type=int, default=2000, help="synthetic updates to send")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="relative weights of message/mention/<command>")
+    parser.add_argument("--chats", type=int, default=20, help="synthetic group chats")
+    parser.add_argument("--users", type=int, default=30, help="members per chat")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=64, help="max updates in flight")
+    parser.add_argument("--rate", type=float, default=0, help="max updates offered per second (0: no cap)")
+    parser.add_argument("--bot-username", default="bench_bot", help="username the stub's getMe reports")
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="seconds per Bot API call")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per model call")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="seconds per Serper search")
+    parser.add_argument("--drain-timeout", type=float, default=600, help="seconds to wait for the last updates")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="result file (default benchmarks/results/replay-<time>.json)")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    fake_llm = FakeOpenAI(latency=args.llm_latency, search_latency=args.search_latency, tool_calls=True).start()
+    with local_postgres() as database_url:
+        configure_bot(database_url, fake_llm, args.log_level)
+        results = asyncio.run(replay(args, fake_llm))
+    fake_llm.stop()
+    save_results(args, started, results, prefix="replay-")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Offline benchmarks of the ingestion and summarization hot paths.
+
+    python -m benchmarks.run [--suites ingest,prompt,query,summarize] [--rows 1000000,10000000]
+
+Runs against a local Postgres (see benchmarks/postgres.py) and a fake model
+endpoint, never the real Telegram, model or Serper APIs. Suites:
+- ingest:    messages/s through log_message and the write-behind buffer
+- prompt:    building the compacted transcript for a busy chat's day
+- query:     get_messages_in_range / get_user_messages_in_range latency
+             percentiles once the messages table holds each --rows size
+- summarize: /summarize of a full past day end to end (query, hourly partial
+             summaries, final call) with --llm-latency per model call
+
+Results are written as JSON to --output (default benchmarks/results/<time>.json);
+compare two runs with python -m benchmarks.compare old.json new.json.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.postgres import local_postgres
+
+SUITES = ("ingest", "prompt", "query", "summarize")
+
+
+def percentiles(samples) -> dict:
+    """Latency summary in milliseconds of samples given in seconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _update(row):
+    chat_id, user_name, user_id, text, timestamp, chat_title = row
+    return SimpleNamespace(message=SimpleNamespace(
+        chat_id=chat_id,
+        from_user=SimpleNamespace(id=user_id, first_name=user_name, last_name=None),
+        text=text,
+        date=timestamp,
+        chat=SimpleNamespace(title=chat_title),
+    ))
+
+
+async def bench_ingest(generator, count: int) -> dict:
+    """Feeds count messages through log_message as the bot would and waits until all are committed."""
+    from database import log_message, message_buffer
+
+    rows = []
+    for _, day_rows in generator.days_back(_hk_today()):
+        rows.extend(day_rows[:count - len(rows)])
+        if len(rows) == count:
+            break
+    updates = [_update(row) for row in rows]
+
+    handler_seconds = []
+    started = time.perf_counter()
+    message_buffer.start()
+    for update in updates:
+        handler_started = time.perf_counter()
+        await log_message(update, None)
+        handler_seconds.append(time.perf_counter() - handler_started)
+        # Each update is its own task in the bot, so the loop gets a turn in between
+        await asyncio.sleep(0)
+    await message_buffer.stop()
+    elapsed = time.perf_counter() - started
+    return {
+        "messages": len(updates),
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(len(updates) / elapsed, 1),
+        "log_message": percentiles(handler_seconds),
+    }
+
+
+async def bench_prompt(generator, iterations: int) -> dict:
+    """Compacts one chat's full day of messages, as summarize_chat_range does for an open range."""
+    from transcript import compact_rows
+
+    chat_id = generator.chat_ids[0]
+    rows = [(row[1], row[3], row[4]) for row in generator.day(_hk_today() - timedelta(days=1)) if row[0] == chat_id]
+    samples = []
+    transcript = None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        transcript = compact_rows(rows, bot_name="@bench_bot", drop_bot=True, label="bench")
+        samples.append(time.perf_counter() - started)
+    return {
+        "rows": len(rows),
+        "raw_tokens": transcript.raw_tokens,
+        "prompt_tokens": transcript.tokens,
+        "compact_rows": percentiles(samples),
+    }
+
+
+class HistoryLoader:
+    """Bulk-loads generated history with COPY, newest day first, so the table can grow in steps."""
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.days = generator.days_back(_hk_today() - timedelta(days=1))
+        self.rows = 0
+        self.loaded_days = []
+
+    async def grow_to(self, target: int):
+        from database import DatabasePool, ensure_message_partitions
+
+        db_pool = DatabasePool.get_pool()
+        conn = await db_pool.getconn()
+        try:
+            while self.rows < target:
+                day, rows = next(self.days)
+                async with conn.transaction():
+                    cursor = conn.cursor()
+                    await ensure_message_partitions(cursor, first_month=day)
+                    async with cursor.copy(
+                        "COPY messages (chat_id, user_name, user_id, text, timestamp, chat_title) FROM STDIN"
+                    ) as copy:
+                        for row in rows:
+                            await copy.write_row(row)
+                self.rows += len(rows)
+                self.loaded_days.append(day)
+            await conn.execute("ANALYZE messages")
+        finally:
+            await db_pool.putconn(conn)
+
+
+async def bench_query(generator, loader, sizes, queries: int) -> dict:
+    from db import DatabaseOperations
+
+    db_ops = DatabaseOperations()
+    rng = random.Random(generator.seed)
+    results = {}
+    for size in sizes:
+        started = time.perf_counter()
+        await loader.grow_to(size)
+        load_seconds = time.perf_counter() - started
+        day_range, hour_range, user_range = [], [], []
+        for _ in range(queries):
+            chat_id = rng.choice(generator.chat_ids)
+            day = rng.choice(loader.loaded_days)
+            day_start = datetime(day.year, day.month, day.day, tzinfo=_hk())
+            hour_start = day_start + timedelta(hours=rng.randrange(24))
+            user_id = generator.members[chat_id][0][0][0]
+
+            for samples, call in (
+                (day_range, db_ops.get_messages_in_range(chat_id, day_start, day_start + timedelta(days=1))),
+                (hour_range, db_ops.get_messages_in_range(chat_id, hour_start, hour_start + timedelta(hours=1))),
+                (user_range, db_ops.get_user_messages_in_range(chat_id, user_id, day_start,
+                                                               day_start + timedelta(days=1))),
+            ):
+                query_started = time.perf_counter()
+                await call
+                samples.append(time.perf_counter() - query_started)
+        results[str(size)] = {
+            "rows": loader.rows,
+            "load_seconds": round(load_seconds, 1),
+            "day_range": percentiles(day_range),
+            "hour_range": percentiles(hour_range),
+            "user_day_range": percentiles(user_range),
+        }
+    return results
+
+
+async def bench_summarize(generator, loader, iterations: int, fake_llm) -> dict:
+    """
+    Summarizes one chat's most recent full day. The first run builds and stores
+    the hourly partial summaries (cold); the rest reuse them (warm). The summary
+    cache is cleared before every run so each one reaches the model.
+    """
+    from database import DatabasePool
+    from db import DatabaseOperations
+    from summarizer import summarize_chat_range, summary_cache
+
+    await loader.grow_to(1)
+    chat_id = generator.chat_ids[0]
+    day = loader.loaded_days[0]
+    start = datetime(day.year, day.month, day.day, tzinfo=_hk())
+    end = start + timedelta(days=1)
+
+    conn = await DatabasePool.get_pool().getconn()
+    try:
+        await conn.execute("DELETE FROM hourly_summaries WHERE chat_id = %s", (chat_id,))
+    finally:
+        await DatabasePool.get_pool().putconn(conn)
+
+    samples, model_calls = [], []
+    rows = []
+    for _ in range(iterations):
+        summary_cache.clear()
+        requests_before = fake_llm.requests
+        started = time.perf_counter()
+        rows = await DatabaseOperations().get_messages_in_range(chat_id, start, end)
+        await summarize_chat_range(chat_id, rows, start, end, bot_name="@bench_bot")
+        samples.append(time.perf_counter() - started)
+        model_calls.append(fake_llm.requests - requests_before)
+    return {
+        "rows": len(rows),
+        "llm_latency_seconds": fake_llm.latency,
+        "cold_ms": round(samples[0] * 1000, 1),
+        "cold_model_calls": model_calls[0],
+        "warm": percentiles(samples[1:]),
+        "warm_model_calls": model_calls[-1],
+    }
+
+
+async def _truncate():
+    from database import DatabasePool
+
+    db_pool = DatabasePool.get_pool()
+    conn = await db_pool.getconn()
+    try:
+        await conn.execute("TRUNCATE messages, hourly_summaries, llm_calls")
+    finally:
+        await db_pool.putconn(conn)
+
+
+def _hk():
+    from config import HK_TIMEZONE
+    return HK_TIMEZONE
+
+
+def _hk_today():
+    return datetime.now(_hk()).date()
+
+
+def configure_bot(database_url: str, fake_llm, log_level: str):
+    """Points the bot's config at the benchmark stand-ins. Must run before any bot module is imported."""
+    # config reads these at import time
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["BASE_URL"] = fake_llm.url
+    for name, value in (("API_KEY", "bench"), ("MODEL", "bench-model"), ("BOT_TOKEN", "bench"),
+                        ("SERPER_API_KEY", "bench")):
+        os.environ.setdefault(name, value)
+    import config
+    logging.getLogger().setLevel(log_level)
+    config.logger.setLevel(log_level)
+
+
+def save_results(args, started: datetime, results: dict, prefix: str = ""):
+    record = {
+        "started": started.isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "params": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmarks", "results", f"{prefix}{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as sink:
+        json.dump(record, sink, indent=2, ensure_ascii=False)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"Results written to {output}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+async def run(args, fake_llm) -> dict:
+    from benchmarks.chatgen import ChatGenerator
+    from database import DatabasePool, init_db
+
+    generator = ChatGenerator(args.chats, args.users, args.messages_per_day, args.seed)
+    suites = args.suites.split(",")
+    results = {}
+
+    if "prompt" in suites:
+        results["prompt"] = await bench_prompt(generator, args.iterations * 10)
+
+    await DatabasePool.init_pool()
+    try:
+        await init_db()
+        await _truncate()
+
+        loader = HistoryLoader(generator)
+        if "ingest" in suites:
+            results["ingest"] = await bench_ingest(generator, args.ingest_messages)
+            # The ingested rows overlap the generated history, so start the other suites clean
+            await _truncate()
+        if "summarize" in suites:
+            results["summarize"] = await bench_summarize(generator, loader, args.iterations, fake_llm)
+        if "query" in suites:
+            sizes = sorted(int(size) for size in args.rows.split(","))
+            results["query"] = await bench_query(generator, loader, sizes, args.queries)
+    finally:
+        from ai import close_ai_client
+        await close_ai_client()
+        await DatabasePool.close_pool()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, queries and summarization offline.")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma-separated subset of {','.join(SUITES)}")
+    parser.add_argument("--chats", type=int, default=20, help="synthetic group chats")
+    parser.add_argument("--users", type=int, default=30, help="members per chat")
+    parser.add_argument("--messages-per-day", type=int, default=2000, help="messages per chat per day")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rows", default="1000000,10000000", help="messages table sizes for the query suite")
+    parser.add_argument("--queries", type=int, default=200, help="queries of each kind per table size")
+    parser.add_argument("--ingest-messages", type=int, default=50000)
+    parser.add_argument("--iterations", type=int, default=5, help="/summarize runs (the first one is cold)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the fake model takes per call")
+    parser.add_argument("--log-level", default="WARNING", help="bot log level; INFO includes per-message logging cost")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<time>.json)")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    fake_llm = FakeOpenAI(latency=args.llm_latency).start()
+    with local_postgres() as database_url:
+        configure_bot(database_url, fake_llm, args.log_level)
+        results = asyncio.run(run(args, fake_llm))
+    fake_llm.stop()
+    save_results(args, started, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+In-process Bot API stand-in for the load harness.
+
+StubBotRequest plugs into Application.builder().request(); every Bot API call
+is answered locally after `latency` seconds with a plausible result, so the
+handlers run unchanged without reaching Telegram.
+"""
+import asyncio
+import io
+import itertools
+import json
+import time
+from collections import Counter
+from telegram.request import BaseRequest
+
+try:
+    from PIL import Image
+except ImportError:  # photos then download as empty files
+    Image = None
+
+BOT_ID = 999000
+
+
+class StubBotRequest(BaseRequest):
+    def __init__(self, latency: float = 0.0, bot_username: str = "bench_bot"):
+        self.latency = latency
+        self.bot_user = {"id": BOT_ID, "is_bot": True, "first_name": "Bench", "username": bot_username}
+        self.calls = Counter()
+        self._message_ids = itertools.count(1_000_000)
+        self._photo = None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if "/file/bot" in url:
+            self.calls["download"] += 1
+            return 200, self._photo_bytes()
+        name = url.rsplit("/", 1)[-1]
+        self.calls[name] += 1
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({"ok": True, "result": self._result(name, params)}).encode()
+
+    def _result(self, name: str, params: dict):
+        if name == "getMe":
+            return self.bot_user
+        if name == "getChatMember":
+            return {"status": "creator", "user": self.bot_user, "is_anonymous": False}
+        if name == "getFile":
+            return {"file_id": params.get("file_id"), "file_unique_id": f"u{params.get('file_id')}",
+                    "file_size": len(self._photo_bytes()), "file_path": "photos/bench.jpg"}
+        if name.startswith(("send", "edit")) and name != "sendChatAction" and "chat_id" in params:
+            return {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": int(params["chat_id"]), "type": "supergroup"},
+                "from": self.bot_user,
+                "text": params.get("text") or params.get("caption") or "",
+            }
+        return True
+
+    def _photo_bytes(self) -> bytes:
+        if self._photo is None:
+            self._photo = b""
+            if Image is not None:
+                buffer = io.BytesIO()
+                Image.new("RGB", (1280, 960), (200, 120, 80)).save(buffer, "JPEG")
+                self._photo = buffer.getvalue()
+        return self._photo
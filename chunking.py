@@ -0,0 +1,83 @@
+import math
+
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x3000 <= code <= 0x9FFF      # CJK punctuation, kana, unified ideographs
+        or 0x3400 <= code <= 0x4DBF   # extension A
+        or 0xF900 <= code <= 0xFAFF   # compatibility ideographs
+        or 0xFF00 <= code <= 0xFFEF   # full-width forms
+        or 0x20000 <= code <= 0x2FA1F # extensions B+, used for some Cantonese characters
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for mixed Cantonese/English chat text, without a tokenizer.
+    Chinese characters cost about one token each, ASCII about four characters per
+    token, and emoji and other symbols about two tokens each. Errs on the high side.
+    """
+    cjk = ascii_chars = other = 0
+    for char in text:
+        if char.isascii():
+            ascii_chars += 1
+        elif _is_cjk(char):
+            cjk += 1
+        else:
+            other += 1
+    return cjk + math.ceil(ascii_chars / 4) + other * 2
+
+
+def _turns(rows):
+    """Groups consecutive rows by the same speaker, so chunks never cut a turn in half."""
+    turn = []
+    for row in rows:
+        if turn and row[0] != turn[-1][0]:
+            yield turn
+            turn = []
+        turn.append(row)
+    if turn:
+        yield turn
+
+
+def split_rows(rows, max_tokens: int):
+    """
+    Splits (user_name, text, ...) rows into consecutive chunks of at most about
+    max_tokens each, cutting only between speakers where possible. A single
+    turn longer than the budget is split between its messages instead.
+    """
+    chunks = []
+    chunk, chunk_tokens = [], 0
+    for turn in _turns(rows):
+        turn_tokens = sum(estimate_tokens(f"{row[0]}: {row[1]}") + 1 for row in turn)
+        if turn_tokens > max_tokens:
+            pieces = [[row] for row in turn]
+        else:
+            pieces = [turn]
+        for piece in pieces:
+            piece_tokens = turn_tokens if piece is turn else estimate_tokens(f"{piece[0][0]}: {piece[0][1]}") + 1
+            if chunk and chunk_tokens + piece_tokens > max_tokens:
+                chunks.append(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk.extend(piece)
+            chunk_tokens += piece_tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def group_texts(texts, max_tokens: int):
+    """Packs texts into consecutive groups of at most about max_tokens each (at least one text per group)."""
+    groups = []
+    group, group_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text) + 2
+        if group and group_tokens + tokens > max_tokens:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(text)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
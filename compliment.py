@@ -3,10 +3,13 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 
-# Import the new vision function and the existing summary function
-from ai import get_ai_summary, get_ai_vision_response
+# Import the summary function and the photo pipeline for vision requests
+from ai import get_ai_summary
+from llm_scheduler import llm_priority, Priority
+from images import get_photo_response
 from config import logger, COMPLIMENT_PROMPTS, AI_GENERATE_BASE_PROMPT
 
+@llm_priority(Priority.LOW)
 async def compliment_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Generates a compliment for a user, based on either a replied-to text message or an image.
@@ -32,19 +35,17 @@ async def compliment_user(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # --- IMAGE HANDLING LOGIC ---
     # Check if the replied-to message contains a photo
     if message.reply_to_message.photo:
-        # Get the lowest resolution 
-        photo = message.reply_to_message.photo[0]
-        # Get the file object from Telegram's servers
-        file = await context.bot.get_file(photo.file_id)
-        # The file_path is a temporary public URL to the image
-        image_url = file.file_path
-
         # Create a prompt for the vision model
         vision_prompt = f"針對呢張相入面嘅 {target_username} ，用你最啜核嘅方式讚美佢。"
 
         waiting_message = await message.reply_text(f"睇緊 {target_username} 張靚相，度緊點讚… ⏳")
-        # Call the new vision function
-        response_text = get_ai_vision_response(vision_prompt, image_url, system_prompt)
+        # Download a suitably sized copy of the photo, shrink it and ask the vision model
+        response_text = await get_photo_response(
+            context.bot, message.reply_to_message.photo, vision_prompt, system_prompt
+        )
+        if response_text is None:
+            await waiting_message.edit_text("下載唔到張圖，請再試一次")
+            return
 
     # --- TEXT HANDLING LOGIC ---
     # Fallback to text if no photo is present
@@ -57,7 +58,7 @@ async def compliment_user(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         waiting_message = await message.reply_text(f"分析緊 ** {target_username} ** 講過嘅嘢… ⏳")
         # Call the standard summary/text function
-        response_text = get_ai_summary(text_prompt, system_prompt)
+        response_text = await get_ai_summary(text_prompt, system_prompt)
     else:
         await message.reply_text("請回覆一個有文字或者有圖片嘅訊息啦！")
         return
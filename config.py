@@ -1,5 +1,5 @@
 from datetime import timedelta, timezone
-from decouple import config
+from decouple import config, Csv
 import os
 
 # Configure logging
@@ -21,6 +21,52 @@ MODEL = config("MODEL")
 API_KEY = config("API_KEY")
 BASE_URL = config("BASE_URL")
 
+# LLM client settings: per-call timeout (seconds) and shared connection pool size
+LLM_TIMEOUT = config("LLM_TIMEOUT", default=60, cast=float)
+LLM_MAX_CONNECTIONS = config("LLM_MAX_CONNECTIONS", default=20, cast=int)
+LLM_MAX_KEEPALIVE_CONNECTIONS = config("LLM_MAX_KEEPALIVE_CONNECTIONS", default=10, cast=int)
+
+# Model calls allowed in flight at once, across all chats
+LLM_MAX_CONCURRENCY = config("LLM_MAX_CONCURRENCY", default=8, cast=int)
+# Queued model calls beyond which low-priority commands are rejected straight away
+LLM_SHED_QUEUE_DEPTH = config("LLM_SHED_QUEUE_DEPTH", default=16, cast=int)
+
+# Updates handled at once; updates from the same chat always run one after another
+UPDATE_CONCURRENCY = config("UPDATE_CONCURRENCY", default=32, cast=int)
+# Updates accepted at once, including those waiting for an earlier update of their chat
+UPDATE_MAX_PENDING = config("UPDATE_MAX_PENDING", default=1000, cast=int)
+
+# "polling" (default) or "webhook". Webhook mode serves WEBHOOK_PATH and /healthz
+# on WEBHOOK_LISTEN:WEBHOOK_PORT and registers WEBHOOK_URL + WEBHOOK_PATH with
+# Telegram; WEBHOOK_SECRET is checked on every pushed update
+BOT_MODE = config("BOT_MODE", default="polling")
+WEBHOOK_URL = config("WEBHOOK_URL", default="")
+WEBHOOK_PATH = config("WEBHOOK_PATH", default="/telegram")
+WEBHOOK_SECRET = config("WEBHOOK_SECRET", default="")
+WEBHOOK_LISTEN = config("WEBHOOK_LISTEN", default="0.0.0.0")
+WEBHOOK_PORT = config("WEBHOOK_PORT", default=8080, cast=int)
+# Concurrent connections Telegram opens to push updates (1-100)
+WEBHOOK_MAX_CONNECTIONS = config("WEBHOOK_MAX_CONNECTIONS", default=40, cast=int)
+
+# Seconds one tool call (e.g. a web search) may take before the model is told it timed out
+TOOL_TIMEOUT = config("TOOL_TIMEOUT", default=15, cast=float)
+
+# Vision requests: photos are fetched at the smallest size reaching VISION_TARGET_SIZE
+# pixels on the longer side, then downscaled to it and re-encoded as JPEG in worker threads
+VISION_TARGET_SIZE = config("VISION_TARGET_SIZE", default=768, cast=int)
+VISION_JPEG_QUALITY = config("VISION_JPEG_QUALITY", default=80, cast=int)
+VISION_WORKERS = config("VISION_WORKERS", default=2, cast=int)
+# Cached encoded photos and vision replies, both keyed by Telegram file_unique_id
+VISION_IMAGE_CACHE_SIZE = config("VISION_IMAGE_CACHE_SIZE", default=32, cast=int)
+VISION_RESPONSE_CACHE_SIZE = config("VISION_RESPONSE_CACHE_SIZE", default=256, cast=int)
+VISION_CACHE_TTL = config("VISION_CACHE_TTL", default=3600, cast=int)
+
+# Minimum seconds between edits of a message while an AI reply streams in
+STREAM_EDIT_INTERVAL = config("STREAM_EDIT_INTERVAL", default=1.5, cast=float)
+
+# Cached Serper searches (freshness depends on the search's time range)
+SERPER_CACHE_SIZE = config("SERPER_CACHE_SIZE", default=512, cast=int)
+
 # Hong Kong ti (UTC+8)
 HK_TIMEZONE = timezone(timedelta(hours=8))
 
@@ -116,6 +162,15 @@ SUMMARIZE_PROMPTS = """
 - 生成的總結不能有虛構內容
 """
 
+# Partial summary prompt for one closed hour of chat (combined later by SUMMARIZE_PROMPTS)
+PARTIAL_SUMMARY_PROMPT = """
+#將以下一段群組對話濃縮成重點摘要，之後會同其他時段嘅摘要合併再總結
+#用繁體中文，逐個話題列出重點，寫清楚邊位用戶講咗乜
+#保留有趣或者令人印象深刻嘅原句
+#唔好加評論、標題或者emoji，唔好自行更改用戶名
+#唔可以有虛構內容
+"""
+
 # SUMMARIZE_USER_PROMPTS
 SUMMARIZE_USER_PROMPTS = """
 #綜合以下條件總結對話
@@ -737,3 +792,66 @@ Ching 我明白嘅😮‍💨 有時返工真係會覺得好撚悶，特別係
 
 # Database URL
 DB_URL = os.getenv("DATABASE_URL", config("DATABASE_URL"))
+
+# Async connection pool sizing; DB_POOL_TIMEOUT is how long a caller waits for a free connection
+DB_POOL_MIN_SIZE = config("DB_POOL_MIN_SIZE", default=1, cast=int)
+DB_POOL_MAX_SIZE = config("DB_POOL_MAX_SIZE", default=20, cast=int)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30.0, cast=float)
+
+# Write-behind message logging: flush after this many rows or seconds, whichever comes first
+MESSAGE_FLUSH_SIZE = config("MESSAGE_FLUSH_SIZE", default=100, cast=int)
+MESSAGE_FLUSH_INTERVAL = config("MESSAGE_FLUSH_INTERVAL", default=2.0, cast=float)
+# Rows a write buffer holds at most while the database is unreachable; the oldest are dropped beyond that
+WRITE_BUFFER_MAX_ROWS = config("WRITE_BUFFER_MAX_ROWS", default=20000, cast=int)
+# Failed batch writes (other than connection errors) after which a batch is retried row by row, dropping the rows the database rejects
+WRITE_BUFFER_MAX_ATTEMPTS = config("WRITE_BUFFER_MAX_ATTEMPTS", default=3, cast=int)
+# Model call accounting rows (llm_calls) are written in batches this often, in seconds
+LLM_CALL_FLUSH_INTERVAL = config("LLM_CALL_FLUSH_INTERVAL", default=10.0, cast=float)
+
+# In-memory cache of today's messages per chat; set either limit to 0 to disable
+DAY_CACHE_MAX_CHATS = config("DAY_CACHE_MAX_CHATS", default=200, cast=int)
+DAY_CACHE_MAX_MB = config("DAY_CACHE_MAX_MB", default=64, cast=int)
+
+# Incremental /summarize: closed hours with at least this many messages are summarized
+# once and stored; an hour counts as closed this many minutes after it ends
+SUMMARY_BUCKET_MIN_MESSAGES = config("SUMMARY_BUCKET_MIN_MESSAGES", default=30, cast=int)
+SUMMARY_BUCKET_GRACE_MINUTES = config("SUMMARY_BUCKET_GRACE_MINUTES", default=2, cast=int)
+# Prompts whose chat text is estimated above SUMMARY_MAX_PROMPT_TOKENS are split into
+# chunks of SUMMARY_CHUNK_TOKENS, summarized at most SUMMARY_MAX_PARALLEL at a time
+SUMMARY_MAX_PROMPT_TOKENS = config("SUMMARY_MAX_PROMPT_TOKENS", default=24000, cast=int)
+SUMMARY_CHUNK_TOKENS = config("SUMMARY_CHUNK_TOKENS", default=8000, cast=int)
+SUMMARY_MAX_PARALLEL = config("SUMMARY_MAX_PARALLEL", default=4, cast=int)
+
+# Finished /summarize and /summarize_user results, reused while no new messages arrive
+SUMMARY_CACHE_SIZE = config("SUMMARY_CACHE_SIZE", default=256, cast=int)
+SUMMARY_CACHE_TTL = config("SUMMARY_CACHE_TTL", default=600, cast=int)
+
+# /golden_quote_king only sends the best-scoring quotes: this many per user, this many
+# overall, each cut to this many characters
+GOLDEN_CANDIDATES_PER_USER = config("GOLDEN_CANDIDATES_PER_USER", default=8, cast=int)
+GOLDEN_MAX_CANDIDATES = config("GOLDEN_MAX_CANDIDATES", default=120, cast=int)
+GOLDEN_QUOTE_MAX_CHARS = config("GOLDEN_QUOTE_MAX_CHARS", default=120, cast=int)
+
+
+# Prompt transcript compaction: names at least this long become short aliases, the
+# bot's own replies and links are cut to this many characters
+COMPACT_ALIAS_MIN_CHARS = config("COMPACT_ALIAS_MIN_CHARS", default=5, cast=int)
+COMPACT_BOT_MAX_CHARS = config("COMPACT_BOT_MAX_CHARS", default=200, cast=int)
+COMPACT_URL_MAX_CHARS = config("COMPACT_URL_MAX_CHARS", default=40, cast=int)
+
+# Telegram user ids allowed to see usage across all chats with /stats all
+STATS_ADMIN_IDS = config("STATS_ADMIN_IDS", default="", cast=Csv(int))
+
+# Prometheus metrics endpoint (/metrics); off unless METRICS_PORT is set
+METRICS_PORT = config("METRICS_PORT", default=0, cast=int)
+METRICS_HOST = config("METRICS_HOST", default="127.0.0.1")
+
+# Per-update traces appended to this JSONL file (view with python tracing.py);
+# off unless set. Traces faster than TRACE_MIN_MS (1 s by default) are not written
+TRACE_FILE = config("TRACE_FILE", default="")
+TRACE_MIN_MS = config("TRACE_MIN_MS", default=1000, cast=int)
+
+# Monthly partitions of the messages table to keep created ahead of time
+MESSAGE_PARTITION_MONTHS_AHEAD = config("MESSAGE_PARTITION_MONTHS_AHEAD", default=3, cast=int)
+# Rebuild an existing unpartitioned messages table on startup (copies every row once)
+MIGRATE_MESSAGES_TO_PARTITIONED = config("MIGRATE_MESSAGES_TO_PARTITIONED", default=False, cast=bool)
@@ -1,25 +1,110 @@
-import psycopg2
-from psycopg2 import pool
-from config import DB_URL, logger, HK_TIMEZONE
-from datetime import datetime
+import asyncio
+import contextvars
+import time
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+from config import (
+    DB_URL,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT,
+    logger,
+    HK_TIMEZONE,
+    MESSAGE_FLUSH_SIZE,
+    MESSAGE_FLUSH_INTERVAL,
+    WRITE_BUFFER_MAX_ROWS,
+    WRITE_BUFFER_MAX_ATTEMPTS,
+    LLM_CALL_FLUSH_INTERVAL,
+    MESSAGE_PARTITION_MONTHS_AHEAD,
+    MIGRATE_MESSAGES_TO_PARTITIONED,
+)
+from datetime import date, datetime
+from day_cache import day_cache
+from metrics import db_pool_wait, db_pool_borrow, db_query_duration
+from tracing import span
+
+
+def _statement_type(query) -> str:
+    words = query.split(None, 1) if isinstance(query, str) else []
+    return words[0].upper() if words else "OTHER"
+
+
+class TimedCursor(psycopg.AsyncCursor):
+    """Cursor that reports every statement's duration to the metrics module and the current trace."""
+
+    async def execute(self, query, params=None, **kwargs):
+        statement = _statement_type(query)
+        started = time.monotonic()
+        try:
+            with span(f"db.{statement.lower()}"):
+                return await super().execute(query, params, **kwargs)
+        finally:
+            db_query_duration.labels(statement).observe(time.monotonic() - started)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        statement = _statement_type(query)
+        started = time.monotonic()
+        try:
+            with span(f"db.{statement.lower()}_many"):
+                return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            db_query_duration.labels(statement).observe(time.monotonic() - started)
+
+
+class TimedPool(AsyncConnectionPool):
+    """Connection pool that reports how long callers wait for a connection and hold it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._borrowed_at = {}
+
+    async def getconn(self, timeout=None):
+        started = time.monotonic()
+        with span("db.getconn"):
+            conn = await super().getconn(timeout)
+        now = time.monotonic()
+        db_pool_wait.observe(now - started)
+        self._borrowed_at[id(conn)] = now
+        return conn
+
+    async def putconn(self, conn):
+        borrowed_at = self._borrowed_at.pop(id(conn), None)
+        if borrowed_at is not None:
+            db_pool_borrow.observe(time.monotonic() - borrowed_at)
+        await super().putconn(conn)
 
 
 class DatabasePool:
     _db_pool = None
 
     @staticmethod
-    def init_pool():
+    async def init_pool():
         if DatabasePool._db_pool is not None:
             logger.info("Database pool already initialized")
             return
+        db_pool = None
         try:
-            DatabasePool._db_pool = psycopg2.pool.SimpleConnectionPool(1, 20, dsn=DB_URL)
-            if DatabasePool._db_pool:
-                logger.info("Database pool initialized successfully")
-            else:
-                raise ValueError("Database pool initialization returned None")
+            db_pool = TimedPool(
+                DB_URL,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                timeout=DB_POOL_TIMEOUT,
+                # Ping idle connections before handing them out, so a dropped
+                # connection is replaced instead of failing the caller's query
+                check=AsyncConnectionPool.check_connection,
+                # Single statements commit on their own; multi-statement writes
+                # open an explicit conn.transaction() block
+                kwargs={"autocommit": True, "cursor_factory": TimedCursor},
+                open=False,
+            )
+            await db_pool.open(wait=True)
+            DatabasePool._db_pool = db_pool
+            logger.info(f"Database pool initialized successfully ({DB_POOL_MIN_SIZE}-{DB_POOL_MAX_SIZE} connections)")
         except Exception as e:
             logger.error(f"Failed to initialize database pool: {e}")
+            # open() starts its workers and connection attempts before it can time out
+            if db_pool is not None:
+                await db_pool.close()
             raise RuntimeError(f"Database pool initialization failed: {e}")
 
     @staticmethod
@@ -28,45 +113,376 @@ class DatabasePool:
             raise RuntimeError("Database pool not initialized. Call init_pool() first.")
         return DatabasePool._db_pool
 
+    @staticmethod
+    def is_open() -> bool:
+        return DatabasePool._db_pool is not None
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Returns pool usage counters. pool_size/pool_available/requests_waiting describe
+        the current saturation; the requests_* totals accumulate since startup.
+        """
+        db_pool = DatabasePool.get_pool()
+        stats = db_pool.get_stats()
+        in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+        stats["connections_in_use"] = in_use
+        stats["saturation"] = in_use / db_pool.max_size if db_pool.max_size else 0.0
+        return stats
+
+    @staticmethod
+    async def close_pool():
+        if DatabasePool._db_pool is not None:
+            await DatabasePool._db_pool.close()
+            DatabasePool._db_pool = None
+            logger.info("Database pool closed")
+
+
+MESSAGE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_messages_chat_ts ON messages (chat_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_chat_user_ts ON messages (chat_id, user_id, timestamp)",
+)
+
+
+def _add_months(month_start: date, months: int) -> date:
+    year, month = divmod(month_start.month - 1 + months, 12)
+    return date(month_start.year + year, month + 1, 1)
+
+
+async def _messages_table_kind(cursor):
+    """Returns 'p' for a partitioned messages table, 'r' for a plain one, None if missing."""
+    await cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('messages')")
+    result = await cursor.fetchone()
+    return result[0] if result else None
 
-def init_db():
+
+async def _create_partitioned_messages(cursor, id_column="id BIGSERIAL"):
+    await cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS messages (
+            {id_column},
+            chat_id BIGINT,
+            user_name TEXT,
+            user_id BIGINT,
+            text TEXT,
+            timestamp TIMESTAMP NOT NULL,
+            chat_title TEXT,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    # Catches rows outside every monthly partition (very old history, clock skew)
+    await cursor.execute("CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT")
+
+
+async def ensure_message_partitions(cursor, first_month: date = None, months_ahead: int = MESSAGE_PARTITION_MONTHS_AHEAD):
+    """
+    Creates the monthly partitions of messages from first_month (default: this month)
+    up to months_ahead months from now. Existing partitions are left alone.
+    """
+    this_month = datetime.now(HK_TIMEZONE).date().replace(day=1)
+    month = (first_month or this_month).replace(day=1)
+    last_month = _add_months(this_month, months_ahead)
+    while month <= last_month:
+        next_month = _add_months(month, 1)
+        name = f"messages_y{month.year}m{month.month:02d}"
+        await cursor.execute("SAVEPOINT create_partition")
+        try:
+            await cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages
+                FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')
+            """)
+            await cursor.execute("RELEASE SAVEPOINT create_partition")
+        except psycopg.Error as e:
+            # Usually means messages_default already holds rows for this month
+            await cursor.execute("ROLLBACK TO SAVEPOINT create_partition")
+            logger.warning(f"Could not create partition {name}: {e}")
+        month = next_month
+
+
+async def migrate_messages_to_partitioned(cursor):
+    """
+    Rebuilds a plain messages table as a monthly partitioned one, keeping ids and rows.
+    Must run inside the caller's transaction, so a failure leaves the old table untouched.
+    """
+    logger.info("Migrating messages table to monthly partitions")
+    await cursor.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    await cursor.execute("ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey")
+    await cursor.execute("DROP INDEX IF EXISTS idx_messages_chat_ts, idx_messages_chat_user_ts")
+    await cursor.execute("ALTER SEQUENCE messages_id_seq AS BIGINT")
+
+    await _create_partitioned_messages(cursor, id_column="id BIGINT NOT NULL DEFAULT nextval('messages_id_seq')")
+    await cursor.execute("SELECT MIN(timestamp) FROM messages_legacy")
+    oldest = (await cursor.fetchone())[0]
+    await ensure_message_partitions(cursor, first_month=oldest.date() if oldest else None)
+
+    await cursor.execute("""
+        INSERT INTO messages (id, chat_id, user_name, user_id, text, timestamp, chat_title)
+        SELECT id, chat_id, user_name, user_id, text, COALESCE(timestamp, 'epoch'), chat_title
+        FROM messages_legacy
+    """)
+    logger.info(f"Copied {cursor.rowcount} row(s) into partitioned messages table")
+    await cursor.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    await cursor.execute("DROP TABLE messages_legacy")
+
+
+async def init_db():
     db_pool = DatabasePool.get_pool()
     conn = None
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id SERIAL PRIMARY KEY,
-                chat_id BIGINT,
-                user_name TEXT,
-                user_id BIGINT,
-                text TEXT,
-                timestamp TIMESTAMP,
-                chat_title TEXT
-            )
-        """)
-        
-        # Create table for tracking daily AI chat usage
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS daily_ai_usage (
-                id SERIAL PRIMARY KEY,
-                chat_id BIGINT,
-                usage_date DATE,
-                usage_count INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(chat_id, usage_date)
-            )
-        """)
-        conn.commit()
+        conn = await db_pool.getconn()
+        async with conn.transaction():
+            cursor = conn.cursor()
+
+            table_kind = await _messages_table_kind(cursor)
+            if table_kind is None:
+                await _create_partitioned_messages(cursor)
+            elif table_kind == "r":
+                if MIGRATE_MESSAGES_TO_PARTITIONED:
+                    await migrate_messages_to_partitioned(cursor)
+                else:
+                    logger.warning(
+                        "messages table is not partitioned; set MIGRATE_MESSAGES_TO_PARTITIONED=true to migrate it"
+                    )
+            if await _messages_table_kind(cursor) == "p":
+                await ensure_message_partitions(cursor)
+
+            for statement in MESSAGE_INDEXES:
+                await cursor.execute(statement)
+
+            # Create table for tracking daily AI chat usage
+            await cursor.execute("""
+                CREATE TABLE IF NOT EXISTS daily_ai_usage (
+                    id SERIAL PRIMARY KEY,
+                    chat_id BIGINT,
+                    usage_date DATE,
+                    usage_count INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(chat_id, usage_date)
+                )
+            """)
+
+            # Cached summaries of closed one-hour buckets, reused by /summarize
+            await cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hourly_summaries (
+                    chat_id BIGINT,
+                    bucket_start TIMESTAMPTZ,
+                    message_count INTEGER,
+                    summary TEXT,
+                    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (chat_id, bucket_start)
+                )
+            """)
+
+            # One row per model call, for /stats
+            await cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    id BIGSERIAL PRIMARY KEY,
+                    created_at TIMESTAMPTZ NOT NULL,
+                    command TEXT,
+                    chat_id BIGINT,
+                    model TEXT,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    tokens_estimated BOOLEAN DEFAULT FALSE,
+                    queue_ms INTEGER,
+                    latency_ms INTEGER,
+                    outcome TEXT
+                )
+            """)
+            await cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_chat_created ON llm_calls (chat_id, created_at)")
+            await cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls (created_at)")
         logger.info("Database schema initialized")
     except Exception as e:
         logger.error(f"Failed to initialize database schema: {e}")
         raise
     finally:
         if conn:
-            db_pool.putconn(conn)
+            await db_pool.putconn(conn)
+
+
+async def maintain_message_partitions(interval: float = 24 * 60 * 60):
+    """Background task that keeps the next months' partitions created while the bot runs."""
+    while True:
+        await asyncio.sleep(interval)
+        db_pool = DatabasePool.get_pool()
+        conn = None
+        try:
+            conn = await db_pool.getconn()
+            async with conn.transaction():
+                cursor = conn.cursor()
+                if await _messages_table_kind(cursor) == "p":
+                    await ensure_message_partitions(cursor)
+        except Exception as e:
+            logger.error(f"Failed to maintain message partitions: {e}")
+        finally:
+            if conn:
+                await db_pool.putconn(conn)
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer for one table.
+
+    Rows are queued in memory and written by one pipelined executemany() in a
+    single transaction when the buffer reaches flush_size rows or every
+    flush_interval seconds, whichever comes first. Rows that fail to write are
+    kept for the next attempt. After max_attempts failures in a row that were
+    not connection errors, the batch is written row by row, and rows the
+    database rejects are dropped. At most max_rows rows are held; beyond that
+    the oldest are dropped.
+    """
+
+    INSERT_SQL = None
+    LABEL = "row"
+
+    def __init__(self, flush_size: int = MESSAGE_FLUSH_SIZE, flush_interval: float = MESSAGE_FLUSH_INTERVAL,
+                 max_rows: int = WRITE_BUFFER_MAX_ROWS, max_attempts: int = WRITE_BUFFER_MAX_ATTEMPTS):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.max_attempts = max_attempts
+        self._failures = 0
+        self._pending = []
+        self._inflight = []
+        self._flush_lock = asyncio.Lock()
+        self._timer_task = None
+        self._size_task = None
+
+    def _queue(self, row: tuple):
+        self._pending.append(row)
+        self._trim()
+        if len(self._pending) >= self.flush_size and (self._size_task is None or self._size_task.done()):
+            # A fresh context, so the flush's spans do not land in the trace of the update that filled the buffer
+            self._size_task = asyncio.create_task(self.flush(), context=contextvars.Context())
+
+    def _trim(self):
+        overflow = len(self._inflight) + len(self._pending) - self.max_rows
+        if overflow > 0:
+            # Drop a tenth of the buffer at once, so a long outage logs now and then, not per row
+            overflow = min(len(self._pending), max(overflow, self.max_rows // 10))
+            del self._pending[:overflow]
+            logger.error(f"{self.LABEL.capitalize()} buffer full: dropped the {overflow} oldest unsaved row(s)")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._inflight, self._pending = self._pending, []
+            db_pool = DatabasePool.get_pool()
+            conn = None
+            try:
+                conn = await db_pool.getconn()
+                if self._failures >= self.max_attempts:
+                    await self._write_each(conn)
+                else:
+                    async with conn.transaction():
+                        # executemany pipelines the batch, so it costs one round trip
+                        await conn.cursor().executemany(self.INSERT_SQL, self._inflight)
+                    logger.info(f"Flushed {len(self._inflight)} buffered {self.LABEL}(s) to database")
+                self._failures = 0
+            except Exception as e:
+                # An unreachable database says nothing about the rows, so only other errors count
+                if not isinstance(e, psycopg.OperationalError):
+                    self._failures += 1
+                logger.error(f"Failed to flush {len(self._inflight)} buffered {self.LABEL}(s) "
+                             f"(failed attempts: {self._failures}): {e}")
+                # Keep the rows for the next attempt, ahead of anything that arrived meanwhile
+                self._pending = self._inflight + self._pending
+                self._inflight = []
+                self._trim()
+            finally:
+                self._inflight = []
+                if conn:
+                    await db_pool.putconn(conn)
+
+    async def _write_each(self, conn):
+        """
+        Writes the in-flight rows one at a time (autocommit), dropping rows the
+        database rejects. A connection error stops the loop and leaves the rows
+        not yet written in _inflight for the caller to keep.
+        """
+        cursor = conn.cursor()
+        written = 0
+        for index, row in enumerate(self._inflight):
+            try:
+                await cursor.execute(self.INSERT_SQL, row)
+                written += 1
+            except psycopg.OperationalError:
+                self._inflight = self._inflight[index:]
+                raise
+            except psycopg.Error as e:
+                logger.error(f"Dropped {self.LABEL} the database rejected: {row!r}: {e}")
+        logger.info(f"Flushed {written} buffered {self.LABEL}(s) to database row by row")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._run())
+            logger.info(f"{self.LABEL.capitalize()} buffer started (flush every {self.flush_size} rows or {self.flush_interval}s)")
+
+    async def stop(self):
+        """Stops the periodic flush and writes out whatever is still buffered."""
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            self._timer_task = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"{len(self._pending)} buffered {self.LABEL}(s) could not be saved on shutdown")
+
+
+class MessageBuffer(WriteBuffer):
+    """
+    Write-behind buffer for the messages table. Rows stay visible through
+    buffered_rows() until they are committed, so readers never miss a message
+    that is still in flight.
+    """
+
+    INSERT_SQL = "INSERT INTO messages (chat_id, user_name, user_id, text, timestamp, chat_title) VALUES (%s, %s, %s, %s, %s, %s)"
+    LABEL = "message"
+
+    def add(self, chat_id, user_name, user_id, text, timestamp, chat_title):
+        self._queue((chat_id, user_name, user_id, text, timestamp, chat_title))
+
+    def buffered_rows(self, chat_id, start_time, end_time, user_id=None, with_user_id=False):
+        """
+        Returns not-yet-committed rows as (user_name, text, timestamp), oldest first,
+        or as (user_id, user_name, text, timestamp) when with_user_id is set.
+        An end_time of None leaves the range open-ended.
+        """
+        rows = [
+            (row[2], row[1], row[3], row[4]) if with_user_id else (row[1], row[3], row[4])
+            for row in self._inflight + self._pending
+            if row[0] == chat_id
+            and (user_id is None or row[2] == int(user_id))
+            and start_time <= row[4]
+            and (end_time is None or row[4] < end_time)
+        ]
+        rows.sort(key=lambda row: row[-1])
+        return rows
+
+
+class LLMCallBuffer(WriteBuffer):
+    """Write-behind buffer for llm_calls, so accounting never delays a reply."""
+
+    INSERT_SQL = """
+        INSERT INTO llm_calls (created_at, command, chat_id, model, prompt_tokens, completion_tokens,
+                               tokens_estimated, queue_ms, latency_ms, outcome)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    LABEL = "LLM call"
+
+    def add(self, created_at, command, chat_id, model, prompt_tokens, completion_tokens,
+            tokens_estimated, queue_ms, latency_ms, outcome):
+        self._queue((created_at, command, chat_id, model, prompt_tokens, completion_tokens,
+                     tokens_estimated, queue_ms, latency_ms, outcome))
+
+
+message_buffer = MessageBuffer()
+llm_call_buffer = LLMCallBuffer(flush_interval=LLM_CALL_FLUSH_INTERVAL)
 
 
 async def log_message(update, context):
@@ -84,118 +500,130 @@ async def log_message(update, context):
 
         logger.info(f"Received message in chat {chat_id} ({chat_title}) from {user_name} (ID: {user_id}): {message}")
 
-        db_pool = DatabasePool.get_pool()
-        conn = None
-        try:
-            conn = db_pool.getconn()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO messages (chat_id, user_name, user_id, text, timestamp, chat_title) VALUES (%s, %s, %s, %s, %s, %s)",
-                (chat_id, user_name, user_id, message, timestamp, chat_title)
-            )
-            conn.commit()
-            logger.info(f"Message saved to database for chat {chat_id} ({chat_title})")
-        except Exception as e:
-            logger.error(f"Failed to log message to database: {e}")
-            await update.message.reply_text("哎呀，儲存訊息時出錯！請稍後再試。")
-        finally:
-            if conn:
-                db_pool.putconn(conn)
+        message_buffer.add(chat_id, user_name, user_id, message, timestamp, chat_title)
+        day_cache.append(chat_id, user_id, user_name, message, timestamp)
 
 
 async def log_bot_reply(chat_id: int, chat_title: str, text: str, bot_id: int, bot_name: str):
     """Logs the bot's own replies."""
     timestamp = datetime.now(HK_TIMEZONE)
+    message_buffer.add(chat_id, bot_name, bot_id, text, timestamp, chat_title)
+    day_cache.append(chat_id, bot_id, bot_name, text, timestamp)
+    logger.info(f"Bot reply queued for database in chat {chat_id} ({chat_title})")
+
+
+# chat_id -> (HK date, usage_count) as last seen in the database. Counts only
+# ever grow within a day, so a chat seen at its limit can be refused without a query.
+_usage_counts = {}
+
+
+async def reserve_daily_usage(chat_id: int, max_usage: int = 20) -> tuple[bool, int | None]:
+    """
+    Atomically takes one use from the chat's daily quota in a single statement.
+    Returns (reserved, remaining_usage). Call refund_daily_usage() if the
+    reserved use ends up not being delivered. If the database cannot be
+    reached the use is allowed but not counted: remaining_usage is None and
+    there is nothing to refund.
+    """
+    # Get today's date in Hong Kong timezone
+    today = datetime.now(HK_TIMEZONE).date()
+    cached_date, cached_count = _usage_counts.get(chat_id, (None, 0))
+    if cached_date == today and cached_count >= max_usage:
+        return False, 0
+
     db_pool = DatabasePool.get_pool()
     conn = None
     try:
-        conn = db_pool.getconn()
+        conn = await db_pool.getconn()
         cursor = conn.cursor()
 
-        sql = "INSERT INTO messages (chat_id, user_name, user_id, text, timestamp, chat_title) VALUES (%s, %s, %s, %s, %s, %s)"
-        params = (chat_id, bot_name, bot_id, text, timestamp, chat_title)
+        # The conditional upsert locks the row, so concurrent reservations can never overshoot
+        await cursor.execute("""
+            INSERT INTO daily_ai_usage (chat_id, usage_date, usage_count)
+            VALUES (%s, %s, 1)
+            ON CONFLICT (chat_id, usage_date)
+            DO UPDATE SET
+                usage_count = daily_ai_usage.usage_count + 1,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE daily_ai_usage.usage_count < %s
+            RETURNING usage_count
+        """, (chat_id, today, max_usage))
+
+        result = await cursor.fetchone()
+        if result is None:
+            _usage_counts[chat_id] = (today, max_usage)
+            logger.info(f"Chat {chat_id} daily usage limit reached ({max_usage})")
+            return False, 0
 
-        # Log the SQL query to be executed (Bot Reply)
-        logger.info(f"Executing SQL (Bot Reply): {cursor.mogrify(sql, params).decode('utf-8')}")
+        _usage_counts[chat_id] = (today, result[0])
+        logger.info(f"Chat {chat_id} daily usage: {result[0]}/{max_usage}")
+        return True, max_usage - result[0]
 
-        cursor.execute(sql, params)
-        conn.commit()
-        logger.info(f"Bot reply saved to database for chat {chat_id} ({chat_title})")
     except Exception as e:
-        logger.error(f"Failed to log bot reply to database: {e}")
+        logger.error(f"Failed to reserve daily usage: {e}")
+        # If there's an error, allow usage to prevent blocking; the remaining count is unknown
+        return True, None
     finally:
         if conn:
-            db_pool.putconn(conn)
+            await db_pool.putconn(conn)
 
 
-def check_daily_usage_limit(chat_id: int, max_usage: int = 20) -> tuple[bool, int]:
+async def refund_daily_usage(chat_id: int) -> bool:
     """
-    Check if the chat has exceeded daily usage limit.
-    Returns (can_use, current_usage_count)
+    Gives back a use taken by reserve_daily_usage, e.g. when the AI call failed.
+    Returns True if successful, False otherwise.
     """
+    today = datetime.now(HK_TIMEZONE).date()
     db_pool = DatabasePool.get_pool()
     conn = None
     try:
-        conn = db_pool.getconn()
+        conn = await db_pool.getconn()
         cursor = conn.cursor()
-        
-        # Get today's date in Hong Kong timezone
-        today = datetime.now(HK_TIMEZONE).date()
-        
-        # Check current usage for today
-        cursor.execute("""
-            SELECT usage_count FROM daily_ai_usage 
+        await cursor.execute("""
+            UPDATE daily_ai_usage
+            SET usage_count = GREATEST(usage_count - 1, 0), updated_at = CURRENT_TIMESTAMP
             WHERE chat_id = %s AND usage_date = %s
+            RETURNING usage_count
         """, (chat_id, today))
-        
-        result = cursor.fetchone()
-        current_usage = result[0] if result else 0
-        
-        can_use = current_usage < max_usage
-        logger.info(f"Chat {chat_id} daily usage: {current_usage}/{max_usage}, can_use: {can_use}")
-        
-        return can_use, current_usage
-        
+        result = await cursor.fetchone()
+        if result is not None:
+            _usage_counts[chat_id] = (today, result[0])
+        logger.info(f"Refunded daily usage for chat {chat_id}")
+        return True
+
     except Exception as e:
-        logger.error(f"Failed to check daily usage limit: {e}")
-        # If there's an error, allow usage to prevent blocking
-        return True, 0
+        logger.error(f"Failed to refund daily usage: {e}")
+        _usage_counts.pop(chat_id, None)
+        return False
     finally:
         if conn:
-            db_pool.putconn(conn)
+            await db_pool.putconn(conn)
 
 
-def increment_daily_usage(chat_id: int) -> bool:
+async def save_hourly_summary(chat_id: int, bucket_start: datetime, message_count: int, summary: str) -> bool:
     """
-    Increment the daily usage count for a chat.
+    Stores (or replaces) the partial summary of one hour of a chat.
     Returns True if successful, False otherwise.
     """
     db_pool = DatabasePool.get_pool()
     conn = None
     try:
-        conn = db_pool.getconn()
+        conn = await db_pool.getconn()
         cursor = conn.cursor()
-        
-        # Get today's date in Hong Kong timezone
-        today = datetime.now(HK_TIMEZONE).date()
-        
-        # Use UPSERT to increment usage count
-        cursor.execute("""
-            INSERT INTO daily_ai_usage (chat_id, usage_date, usage_count) 
-            VALUES (%s, %s, 1)
-            ON CONFLICT (chat_id, usage_date) 
-            DO UPDATE SET 
-                usage_count = daily_ai_usage.usage_count + 1,
-                updated_at = CURRENT_TIMESTAMP
-        """, (chat_id, today))
-        
-        conn.commit()
-        logger.info(f"Incremented daily usage for chat {chat_id}")
+        await cursor.execute("""
+            INSERT INTO hourly_summaries (chat_id, bucket_start, message_count, summary)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (chat_id, bucket_start)
+            DO UPDATE SET
+                message_count = EXCLUDED.message_count,
+                summary = EXCLUDED.summary,
+                created_at = CURRENT_TIMESTAMP
+        """, (chat_id, bucket_start, message_count, summary))
+        logger.info(f"Saved hourly summary for chat {chat_id} at {bucket_start}")
         return True
-        
     except Exception as e:
-        logger.error(f"Failed to increment daily usage: {e}")
+        logger.error(f"Failed to save hourly summary: {e}")
         return False
     finally:
         if conn:
-            db_pool.putconn(conn)
+            await db_pool.putconn(conn)
@@ -0,0 +1,175 @@
+import asyncio
+import sys
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from config import HK_TIMEZONE, DAY_CACHE_MAX_CHATS, DAY_CACHE_MAX_MB, logger
+
+# Rough per-row cost on top of the text itself: the row tuple, its float timestamp
+# and the list slots holding them. User names are interned and shared.
+ROW_OVERHEAD_BYTES = 120
+
+
+def start_of_today():
+    return datetime.now(HK_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class _ChatDay:
+    """Today's messages for one chat, kept sorted by timestamp."""
+
+    __slots__ = ("day", "timestamps", "rows", "size", "ready", "pending")
+
+    def __init__(self, day):
+        self.day = day
+        self.timestamps = []  # epoch seconds, parallel to rows
+        self.rows = []        # (user_id, user_name, text)
+        self.size = 0
+        self.ready = asyncio.Event()
+        self.pending = []     # rows appended while the initial load is running
+
+    def insert(self, timestamp, user_id, user_name, text):
+        row = (user_id, sys.intern(user_name), text)
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            self.rows.append(row)
+        else:
+            index = bisect_right(self.timestamps, timestamp)
+            self.timestamps.insert(index, timestamp)
+            self.rows.insert(index, row)
+        self.size += sys.getsizeof(text) + ROW_OVERHEAD_BYTES
+
+
+class DayCache:
+    """
+    Bounded per-chat cache of the current Hong Kong day's messages.
+
+    A chat is loaded from the database the first time today's range is read,
+    then kept current by append() from the message loggers. Reads that start
+    before today's 00:00 are not served from here. Idle chats are evicted
+    least-recently-used first once max_chats or max_bytes is exceeded.
+    """
+
+    def __init__(self, max_chats: int = DAY_CACHE_MAX_CHATS, max_bytes: int = DAY_CACHE_MAX_MB * 1024 * 1024):
+        self.max_chats = max_chats
+        self.max_bytes = max_bytes
+        self._chats = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_chats > 0 and self.max_bytes > 0
+
+    def _current(self, chat_id):
+        """Returns the chat's entry if it belongs to today, dropping a stale one."""
+        entry = self._chats.get(chat_id)
+        if entry is not None and entry.day != start_of_today():
+            self._drop(chat_id)
+            return None
+        return entry
+
+    def _drop(self, chat_id):
+        entry = self._chats.pop(chat_id, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def _evict(self):
+        for chat_id in list(self._chats):
+            if len(self._chats) <= self.max_chats and self._size <= self.max_bytes:
+                break
+            if self._chats[chat_id].ready.is_set():
+                self._drop(chat_id)
+                logger.info(f"Evicted chat {chat_id} from day cache")
+
+    def append(self, chat_id, user_id, user_name, text, timestamp):
+        """Adds a freshly logged message to a chat that is already cached."""
+        entry = self._current(chat_id)
+        if entry is None or timestamp < entry.day:
+            return
+        if not entry.ready.is_set():
+            entry.pending.append((user_id, user_name, text, timestamp))
+            return
+        before = entry.size
+        entry.insert(timestamp.timestamp(), user_id, user_name, text)
+        self._size += entry.size - before
+        self._chats.move_to_end(chat_id)
+        self._evict()
+
+    async def get_range(self, chat_id, start_time, end_time, load_day, user_id=None):
+        """
+        Returns (user_name, text, timestamp) rows in [start_time, end_time), or None
+        when the range is not cacheable. load_day(chat_id, day_start) must return
+        (user_id, user_name, text, timestamp) rows from day_start onwards, or None
+        on failure.
+        """
+        day = start_of_today()
+        if not self.enabled or start_time < day:
+            return None
+
+        entry = self._current(chat_id)
+        if entry is None:
+            self.misses += 1
+            entry = _ChatDay(day)
+            self._chats[chat_id] = entry
+            try:
+                rows = await load_day(chat_id, day)
+            except Exception:
+                rows = None
+            if rows is None:
+                self._chats.pop(chat_id, None)
+                entry.ready.set()
+                return None
+            self._fill(entry, rows)
+            if self._chats.get(chat_id) is not entry:
+                return self._slice(entry, start_time, end_time, user_id)
+        elif not entry.ready.is_set():
+            self.hits += 1
+            await entry.ready.wait()
+            if self._chats.get(chat_id) is not entry:
+                return None
+        else:
+            self.hits += 1
+
+        self._chats.move_to_end(chat_id)
+        return self._slice(entry, start_time, end_time, user_id)
+
+    def _fill(self, entry, rows):
+        loaded = {}
+        for user_id, user_name, text, timestamp in rows:
+            key = (user_id, user_name, text, timestamp.timestamp())
+            loaded[key] = loaded.get(key, 0) + 1
+            entry.insert(key[3], user_id, user_name, text)
+        # Messages logged while the load query ran may already be in its result
+        for user_id, user_name, text, timestamp in entry.pending:
+            key = (user_id, user_name, text, timestamp.timestamp())
+            if loaded.get(key):
+                loaded[key] -= 1
+            else:
+                entry.insert(key[3], user_id, user_name, text)
+        entry.pending = []
+        self._size += entry.size
+        entry.ready.set()
+        self._evict()
+
+    @staticmethod
+    def _slice(entry, start_time, end_time, user_id=None):
+        lo = bisect_left(entry.timestamps, start_time.timestamp())
+        hi = bisect_left(entry.timestamps, end_time.timestamp())
+        user_id = int(user_id) if user_id is not None else None
+        return [
+            (user_name, text, datetime.fromtimestamp(timestamp, HK_TIMEZONE))
+            for timestamp, (row_user_id, user_name, text) in zip(entry.timestamps[lo:hi], entry.rows[lo:hi])
+            if user_id is None or row_user_id == user_id
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._chats),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+day_cache = DayCache()
@@ -1,5 +1,25 @@
+from collections import Counter
 from config import logger
-from database import DatabasePool
+from database import DatabasePool, message_buffer
+from day_cache import day_cache
+
+
+def _merge_buffered(rows, buffered):
+    """
+    Appends rows that are still in the write-behind buffer to a query result.
+    A row flushed while the query ran can show up in both, so buffered copies
+    already present in the result are dropped.
+    """
+    if not buffered:
+        return rows
+    seen = Counter(rows)
+    merged = list(rows)
+    for row in buffered:
+        if seen[row]:
+            seen[row] -= 1
+        else:
+            merged.append(row)
+    return merged
 
 
 class DatabaseOperations:
@@ -10,40 +30,125 @@ class DatabaseOperations:
             logger.error(f"Database initialization error: {e}")
             raise
 
-    def get_messages_in_range(self, chat_id, start_time, end_time):
+    async def load_day(self, chat_id, day_start):
+        """Loads every message of a chat since day_start, with user ids, for the day cache."""
+        conn = None
+        buffered = message_buffer.buffered_rows(chat_id, day_start, None, with_user_id=True)
+        try:
+            conn = await self.db_pool.getconn()
+            cursor = conn.cursor()
+            await cursor.execute("""
+                SELECT user_id, user_name, text, timestamp::timestamptz FROM messages
+                WHERE chat_id = %s AND timestamp >= %s
+                ORDER BY timestamp ASC
+            """, (chat_id, day_start))
+            rows = await cursor.fetchall()
+            return _merge_buffered(rows, buffered)
+        except Exception as e:
+            logger.error(f"Failed to load day cache for chat {chat_id}: {e}")
+            return None
+        finally:
+            if conn:
+                await self.db_pool.putconn(conn)
+
+    async def get_messages_in_range(self, chat_id, start_time, end_time):
+        cached = await day_cache.get_range(chat_id, start_time, end_time, self.load_day)
+        if cached is not None:
+            return cached
+
         conn = None
+        buffered = message_buffer.buffered_rows(chat_id, start_time, end_time)
         try:
-            conn = self.db_pool.getconn()
+            conn = await self.db_pool.getconn()
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT user_name, text, timestamp FROM messages
+            await cursor.execute("""
+                SELECT user_name, text, timestamp::timestamptz FROM messages
                 WHERE chat_id = %s AND timestamp >= %s AND timestamp < %s
                 ORDER BY timestamp ASC
             """, (chat_id, start_time, end_time))
-            rows = cursor.fetchall()
-            return rows
+            rows = await cursor.fetchall()
+            return _merge_buffered(rows, buffered)
         except Exception as e:
             logger.error(f"Failed to query database: {e}")
             return None
         finally:
             if conn:
-                self.db_pool.putconn(conn)
+                await self.db_pool.putconn(conn)
+
+    async def get_user_messages_in_range(self, chat_id, user_id, start_time, end_time):
+        cached = await day_cache.get_range(chat_id, start_time, end_time, self.load_day, user_id=user_id)
+        if cached is not None:
+            return cached
 
-    def get_user_messages_in_range(self, chat_id, user_id, start_time, end_time):
         conn = None
+        buffered = message_buffer.buffered_rows(chat_id, start_time, end_time, user_id=user_id)
         try:
-            conn = self.db_pool.getconn()
+            conn = await self.db_pool.getconn()
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT user_name, text, timestamp FROM messages
+            await cursor.execute("""
+                SELECT user_name, text, timestamp::timestamptz FROM messages
                 WHERE chat_id = %s AND user_id = %s AND timestamp >= %s AND timestamp < %s
                 ORDER BY timestamp ASC
             """, (chat_id, int(user_id), start_time, end_time))
-            rows = cursor.fetchall()
-            return rows
+            rows = await cursor.fetchall()
+            return _merge_buffered(rows, buffered)
         except Exception as e:
             logger.error(f"Failed to query database: {e}")
             return None
         finally:
             if conn:
-                self.db_pool.putconn(conn)
\ No newline at end of file
+                await self.db_pool.putconn(conn)
+
+    async def get_hourly_summaries(self, chat_id, bucket_starts):
+        """Returns {bucket_start: (message_count, summary)} for the stored buckets among bucket_starts."""
+        if not bucket_starts:
+            return {}
+        conn = None
+        try:
+            conn = await self.db_pool.getconn()
+            cursor = conn.cursor()
+            await cursor.execute("""
+                SELECT bucket_start, message_count, summary FROM hourly_summaries
+                WHERE chat_id = %s AND bucket_start = ANY(%s)
+            """, (chat_id, list(bucket_starts)))
+            rows = await cursor.fetchall()
+            return {row[0]: (row[1], row[2]) for row in rows}
+        except Exception as e:
+            logger.error(f"Failed to query hourly summaries: {e}")
+            return {}
+        finally:
+            if conn:
+                await self.db_pool.putconn(conn)
+
+    async def get_llm_usage(self, since, chat_id=None, group_by: str = "command", limit: int = 20):
+        """
+        Rolls up llm_calls since a point in time, per command (optionally for one chat)
+        or per chat. Rows: (key, calls, prompt_tokens, completion_tokens, p50_ms, p95_ms,
+        failures), busiest by tokens first. Returns None on error.
+        """
+        key = {"command": "COALESCE(command, '-')", "chat": "chat_id::text"}[group_by]
+        conn = None
+        try:
+            conn = await self.db_pool.getconn()
+            cursor = conn.cursor()
+            await cursor.execute(f"""
+                SELECT {key} AS key,
+                       COUNT(*),
+                       COALESCE(SUM(prompt_tokens), 0),
+                       COALESCE(SUM(completion_tokens), 0),
+                       percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms),
+                       percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms),
+                       COUNT(*) FILTER (WHERE outcome <> 'ok')
+                FROM llm_calls
+                WHERE created_at >= %s AND (%s::bigint IS NULL OR chat_id = %s::bigint)
+                GROUP BY key
+                ORDER BY COALESCE(SUM(prompt_tokens), 0) + COALESCE(SUM(completion_tokens), 0) DESC
+                LIMIT %s
+            """, (since, chat_id, chat_id, limit))
+            return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Failed to query LLM usage: {e}")
+            return None
+        finally:
+            if conn:
+                await self.db_pool.putconn(conn)
@@ -1,9 +1,12 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 from config import logger, HK_TIMEZONE, AI_GENERATE_BASE_PROMPT
-from ai import get_ai_summary, get_ai_vision_response
+from ai import get_ai_summary
+from llm_scheduler import llm_priority, Priority
+from images import get_photo_response
 from datetime import datetime
 
+@llm_priority(Priority.LOW)
 async def diu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Generates a playful roast for a user, based on either a replied-to text message or an image.
@@ -29,15 +32,15 @@ async def diu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # --- IMAGE HANDLING LOGIC ---
     # Check if the replied-to message contains a photo
     if message.reply_to_message.photo:
-        photo = message.reply_to_message.photo[0]
-        file = await context.bot.get_file(photo.file_id)
-        image_url = file.file_path
-
         # Create a prompt for the vision model
         vision_prompt = f"針對呢張相，組織一句啜核嘅句子去『Diu』 {target_username}。"
         waiting_message = await message.reply_text(f"幫你睇緊點樣Diu爆 {target_username} 張相… ⏳")
-        # Call the vision function
-        response_text = get_ai_vision_response(vision_prompt, image_url, system_prompt)
+        response_text = await get_photo_response(
+            context.bot, message.reply_to_message.photo, vision_prompt, system_prompt
+        )
+        if response_text is None:
+            await waiting_message.edit_text("下載唔到張圖，請再試一次")
+            return
 
     # --- TEXT HANDLING LOGIC ---
     # Fallback to text if no photo is present
@@ -56,7 +59,7 @@ async def diu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         waiting_message = await message.reply_text(f"幫你諗緊點Diu7 {target_username}… ⏳")
         # Call the standard text function
-        response_text = get_ai_summary(text_prompt, system_prompt)
+        response_text = await get_ai_summary(text_prompt, system_prompt)
     else:
         await message.reply_text("請回覆一個有文字或者有圖片嘅訊息啦！")
         return
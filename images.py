@@ -0,0 +1,98 @@
+import asyncio
+import base64
+import io
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    VISION_TARGET_SIZE,
+    VISION_JPEG_QUALITY,
+    VISION_WORKERS,
+    VISION_IMAGE_CACHE_SIZE,
+    VISION_RESPONSE_CACHE_SIZE,
+    VISION_CACHE_TTL,
+    logger,
+)
+from ai import get_ai_vision_response, VISION_ERRORS
+from cache import TTLCache
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow, photos are sent as downloaded
+    Image = None
+
+# Decoding, resizing and encoding run here, off the event loop
+_image_workers = ThreadPoolExecutor(max_workers=VISION_WORKERS, thread_name_prefix="image")
+
+# Encoded data URLs by file_unique_id, and model replies by (photo, prompt, system prompt):
+# the same meme tends to be targeted several times in a row
+image_cache = TTLCache(VISION_IMAGE_CACHE_SIZE, VISION_CACHE_TTL)
+vision_cache = TTLCache(VISION_RESPONSE_CACHE_SIZE, VISION_CACHE_TTL)
+
+
+def pick_photo_size(photos, target: int = VISION_TARGET_SIZE):
+    """
+    Picks the smallest PhotoSize whose longer side reaches target pixels,
+    or the largest one if none does. Telegram lists sizes smallest first.
+    """
+    sizes = sorted(photos, key=lambda size: size.width * size.height)
+    for size in sizes:
+        if max(size.width, size.height) >= target:
+            return size
+    return sizes[-1]
+
+
+def _encode(data: bytearray, target: int, quality: int) -> str:
+    """Downscales to at most target pixels per side and returns a JPEG data URL."""
+    if Image is not None:
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) > target or image.format != "JPEG":
+                image.thumbnail((target, target))
+                buffer = io.BytesIO()
+                image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+                data = buffer.getbuffer()
+    return "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+
+
+async def prepare_photo(bot, photos) -> str:
+    """
+    Downloads the best-fitting size of a Telegram photo into memory and returns
+    it as a downscaled JPEG data URL for get_ai_vision_response, or None if the
+    download or decoding fails.
+    """
+    size = pick_photo_size(photos)
+    cached = image_cache.get(size.file_unique_id)
+    if cached is not None:
+        return cached
+    try:
+        file = await bot.get_file(size.file_id)
+        data = await file.download_as_bytearray()
+        logger.info(f"Downloaded {size.width}x{size.height} photo ({len(data)} bytes)")
+        loop = asyncio.get_running_loop()
+        image_url = await loop.run_in_executor(_image_workers, _encode, data, VISION_TARGET_SIZE, VISION_JPEG_QUALITY)
+    except Exception as e:
+        logger.error(f"Failed to prepare photo {size.file_unique_id}: {e}")
+        return None
+    image_cache.set(size.file_unique_id, image_url)
+    return image_url
+
+
+async def get_photo_response(bot, photos, user_prompt: str, system_prompt: str, use_cache: bool = True) -> str:
+    """
+    Answers user_prompt about a Telegram photo. With use_cache, a repeat of the
+    same prompt on the same photo is answered from vision_cache, skipping both
+    the download and the model call. Returns None if the photo can't be fetched.
+    """
+    # The largest size identifies the photo whichever size ends up downloaded
+    key = (photos[-1].file_unique_id, user_prompt, system_prompt)
+    if use_cache:
+        cached = vision_cache.get(key)
+        if cached is not None:
+            logger.info(f"Vision cache hit for photo {key[0]}")
+            return cached
+
+    image_url = await prepare_photo(bot, photos)
+    if image_url is None:
+        return None
+    response = await get_ai_vision_response(user_prompt, image_url, system_prompt)
+    if use_cache and response and response not in VISION_ERRORS:
+        vision_cache.set(key, response)
+    return response
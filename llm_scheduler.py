@@ -0,0 +1,170 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from config import LLM_MAX_CONCURRENCY, LLM_SHED_QUEUE_DEPTH, logger
+
+
+class Priority(IntEnum):
+    HIGH = 0    # mention replies, /ask
+    NORMAL = 1  # summaries, golden quote king
+    LOW = 2     # /love, /apologize, countdowns, compliments, roasts
+
+
+class LLMOverloaded(Exception):
+    """Raised instead of queueing low-priority work while the queue is too deep."""
+
+
+# (priority, chat_id, command) of the handler currently making model calls
+_current_request = ContextVar("llm_request", default=(Priority.NORMAL, None, None))
+
+
+def current_request():
+    """Returns (priority, chat_id, command) for model calls made from the current task."""
+    return _current_request.get()
+
+
+@contextmanager
+def llm_request(priority: Priority, chat_id=None, command: str = None):
+    """Tags every model call made inside the block with a priority, chat and command."""
+    token = _current_request.set((priority, chat_id, command))
+    try:
+        yield
+    finally:
+        _current_request.reset(token)
+
+
+def _command_name(update, handler) -> str:
+    """The bot command that triggered the update ("/summarize@bot foo" -> "summarize"), else the handler name."""
+    text = update.effective_message.text if update.effective_message else None
+    if text and text.startswith("/"):
+        return text.split()[0][1:].split("@")[0]
+    return handler.__name__
+
+
+def llm_priority(priority: Priority):
+    """Handler decorator: runs an (update, context, ...) handler inside llm_request for its chat."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context, *args, **kwargs):
+            chat = update.effective_chat
+            with llm_request(priority, chat.id if chat else None, _command_name(update, handler)):
+                return await handler(update, context, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LLMScheduler:
+    """
+    Admission control for model calls.
+
+    At most max_concurrency calls run at once. Waiting calls are served by
+    priority first; within a priority, chats take turns (round robin), so one
+    busy group cannot starve the others. Once shed_depth calls are queued,
+    new low-priority calls fail fast with LLMOverloaded.
+    """
+
+    def __init__(self, max_concurrency: int, shed_depth: int):
+        self.max_concurrency = max_concurrency
+        self.shed_depth = shed_depth
+        self.in_flight = 0
+        # priority -> chat_id -> waiting futures, chats in round-robin order
+        self._queues = {priority: OrderedDict() for priority in Priority}
+        self._queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def queued(self) -> int:
+        """Calls waiting for a slot; a plain counter, safe to read from another thread."""
+        return self._queued
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one concurrency slot for the model call made inside the block."""
+        priority, chat_id, _ = _current_request.get()
+        await self._acquire(priority, chat_id)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: Priority, chat_id) -> None:
+        if self._queued == 0 and self.in_flight < self.max_concurrency:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if priority == Priority.LOW and self._queued >= self.shed_depth:
+            self.shed += 1
+            logger.warning(f"LLM queue depth {self._queued}: shedding low-priority call from chat {chat_id}")
+            raise LLMOverloaded(f"{self._queued} model calls already queued")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(chat_id, deque()).append(waiter)
+        self._queued += 1
+        queued_at = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.cancelled():
+                self._discard(priority, chat_id, waiter)
+            else:
+                # Cancelled right after being granted a slot: hand it on
+                self._release()
+            raise
+        self.admitted += 1
+        self.wait_seconds += time.monotonic() - queued_at
+
+    def _discard(self, priority: Priority, chat_id, waiter) -> None:
+        waiters = self._queues[priority].get(chat_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del self._queues[priority][chat_id]
+
+    def _next_waiter(self):
+        for chats in self._queues.values():
+            if not chats:
+                continue
+            chat_id, waiters = next(iter(chats.items()))
+            waiter = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                chats.move_to_end(chat_id)
+            else:
+                del chats[chat_id]
+            return waiter
+        return None
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        while self.in_flight < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": self._queued,
+            "queued_by_priority": {
+                priority.name.lower(): sum(len(waiters) for waiters in chats.values())
+                for priority, chats in self._queues.items()
+            },
+            "queued_chats": len({chat_id for chats in self._queues.values() for chat_id in chats}),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "avg_wait_seconds": self.wait_seconds / self.admitted if self.admitted else 0.0,
+        }
+
+
+llm_scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_SHED_QUEUE_DEPTH)
@@ -1,8 +1,11 @@
 from ai import get_ai_love_quote
+from llm_scheduler import llm_priority, Priority
 from config import HK_TIMEZONE, logger, COMPLIMENT_PROMPTS
 from db import DatabaseOperations
+from transcript import compact_rows
 from datetime import datetime
 
+@llm_priority(Priority.LOW)
 async def send_love_quote(update, context):
     chat_id = update.message.chat_id
     message = update.message
@@ -19,7 +22,7 @@ async def send_love_quote(update, context):
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
     db_ops = DatabaseOperations()
-    rows = db_ops.get_user_messages_in_range(chat_id, target_user_id, start_of_day, now)
+    rows = await db_ops.get_user_messages_in_range(chat_id, target_user_id, start_of_day, now)
     
     # Check if the message is a reply to another message
     if not message.reply_to_message:
@@ -30,10 +33,10 @@ async def send_love_quote(update, context):
     if rows is None or not rows:
         user_messages = ""
     else:
-        user_messages = "\t".join([f"{row[0]}: {row[1]}" for row in rows])
+        user_messages = compact_rows(rows, aliases=False, label=f"love {target_user_id}").text
         
     waiting_message = await update.message.reply_text(f"諗緊啲甜言蜜語同 ** {target_username} ** 講… ⏳")
-    love_quote = get_ai_love_quote(target_username, user_messages)
+    love_quote = await get_ai_love_quote(target_username, user_messages)
     logger.info(f"Generated love quote for chat {chat_id}: {love_quote}")
 
     if love_quote and love_quote != '哎呀，情話生成失敗，愛你唔使講😜':
@@ -1,10 +1,13 @@
 from telegram.ext import Application, MessageHandler, filters, CommandHandler
 from compliment import compliment_user
-from config import TOKEN, logger, AI_GENERATE_BASE_PROMPT
+from config import TOKEN, logger, AI_GENERATE_BASE_PROMPT, UPDATE_CONCURRENCY, UPDATE_MAX_PENDING, BOT_MODE
 from database import (
     DatabasePool,
     init_db,
     log_message,
+    message_buffer,
+    llm_call_buffer,
+    maintain_message_partitions,
 )  # Import DatabasePool instead of init_db_pool
 from summarize import (
     summarize_day,
@@ -18,12 +21,46 @@ from summarize import (
 )
 from dxx import diu
 from love import send_love_quote
-from ai import get_ai_apology, get_ai_countdown, get_ai_answer_with_tools
+from ai import get_ai_apology, get_ai_countdown, get_ai_answer_with_tools, close_ai_client
+import asyncio
 import pytz
 from datetime import datetime, timedelta
 from ai_chat import handle_chat
+from streaming import StreamingReply
+from llm_scheduler import llm_priority, Priority
+from stats import show_stats
+from metrics import start_metrics_server, timed_handler
+from tracing import TracedRequest, trace_update, trace_writer
+from update_processor import ChatOrderedUpdateProcessor
+from webhook import run_webhook
 
-application = Application.builder().token(TOKEN).build()
+
+async def on_startup(application):
+    try:
+        await DatabasePool.init_pool()
+        await init_db()
+    except Exception as e:
+        logger.error(f"Startup failed: {e}")
+        print(f"Bot cannot start due to: {e}")
+        raise
+    message_buffer.start()
+    llm_call_buffer.start()
+    trace_writer.start()
+    application.create_task(maintain_message_partitions())
+    start_metrics_server(application)
+
+
+async def on_shutdown(application):
+    await message_buffer.stop()
+    await llm_call_buffer.stop()
+    await trace_writer.stop()
+    await DatabasePool.close_pool()
+    await close_ai_client()
+
+
+def instrument(command: str, handler):
+    """Times the handler for /metrics and traces each update it handles."""
+    return timed_handler(command, trace_update(command, handler))
 
 
 async def donate(update, context):
@@ -33,6 +70,7 @@ async def donate(update, context):
     )
 
 
+@llm_priority(Priority.LOW)
 async def countdown_to_retirement(update, context):
     chat_id = update.message.chat_id
     logger.info(f"Starting countdown to retirement for chat {chat_id}")
@@ -76,13 +114,14 @@ async def countdown_to_retirement(update, context):
 
     # Format the countdown message
     waiting_message = await update.message.reply_text("計緊仲有幾耐就退休...")
-    countdown_message = get_ai_countdown(f"距離退休仲有 {total_minutes:,} 分鐘")
+    countdown_message = await get_ai_countdown(f"距離退休仲有 {total_minutes:,} 分鐘")
     if countdown_message:
         await waiting_message.edit_text(countdown_message)
     else:
         await waiting_message.edit_text("計唔L到，叫五仁哥人手計🙇‍♂️")
 
 
+@llm_priority(Priority.LOW)
 async def countdown_to_work(update, context):
     chat_id = update.message.chat_id
     logger.info(f"Starting countdown to work for chat {chat_id}")
@@ -130,13 +169,14 @@ async def countdown_to_work(update, context):
     total_minutes += 1
 
     waiting_message = await update.message.reply_text("計緊仲有幾耐就返工...")
-    countdown_message = get_ai_countdown(f"距離返工時間仲有 {total_minutes:,} 分鐘")
+    countdown_message = await get_ai_countdown(f"距離返工時間仲有 {total_minutes:,} 分鐘")
     if countdown_message:
         await waiting_message.edit_text(countdown_message)
     else:
         await waiting_message.edit_text("計唔L到，叫五仁哥人手計🙇‍♂️")
 
 
+@llm_priority(Priority.LOW)
 async def countdown(update, context):
     chat_id = update.message.chat_id
     logger.info(f"Starting countdown for chat {chat_id}")
@@ -169,19 +209,20 @@ async def countdown(update, context):
         await update.message.reply_text("放左工了！🎉")
         return
     waiting_message = await update.message.reply_text("計緊仲有幾耐先收工...")
-    countdown_message = get_ai_countdown(f"仲有 {total_minutes} 分鐘就放工")
+    countdown_message = await get_ai_countdown(f"仲有 {total_minutes} 分鐘就放工")
     if countdown_message:
         await waiting_message.edit_text(countdown_message)
     else:
         await waiting_message.edit_text("計唔L到，叫五仁哥人手計🙇‍♂️")
 
 
+@llm_priority(Priority.LOW)
 async def apologize(update, context):
     chat_id = update.message.chat_id
     print(f"Starting apology generation for chat {chat_id}")
 
     waiting_message = await update.message.reply_text("度緊呢單野點拆… ⏳")
-    apology = get_ai_apology()
+    apology = await get_ai_apology()
     print(f"Generated apology for chat {chat_id}: {apology}")
 
     if apology and apology != "哎呀，道歉失敗，唔好打我🙏":
@@ -190,6 +231,7 @@ async def apologize(update, context):
         await waiting_message.edit_text("哎呀，道歉失敗，唔好打我🙏")
 
 
+@llm_priority(Priority.HIGH)
 async def answer(update, context):
     chat_id = update.message.chat_id
     message = update.message
@@ -216,46 +258,68 @@ async def answer(update, context):
 
     # Use AI with tool calling capability
     # AI will automatically decide if it needs to search for information
-    answer = get_ai_answer_with_tools(enhanced_message)
+    # The answer streams into the placeholder as it is generated
+    reply = StreamingReply(waiting_message)
+    answer = await get_ai_answer_with_tools(enhanced_message, on_delta=reply.update)
     logger.info(f"Generated answer for chat {chat_id}: {answer[:100]}...")
 
     if answer and answer != "系統想方加(出錯)，好對唔住":
-        await waiting_message.edit_text(answer)
+        await reply.finish(answer)
     else:
-        await waiting_message.edit_text("無氣答，唔好打我🙏")
+        await reply.finish("無氣答，唔好打我🙏")
 
 
-if __name__ == "__main__":
-    try:
-        DatabasePool.init_pool()  # Call the static method to initialize
-        init_db()
-    except Exception as e:
-        logger.error(f"Startup failed: {e}")
-        print(f"Bot cannot start due to: {e}")
-        exit(1)
-
+def register_handlers(application: Application) -> None:
     # Register the AI chat handler for mentions and replies
     application.add_handler(
-        MessageHandler(filters.Text() & ~filters.Command(), handle_chat)
+        MessageHandler(filters.Text() & ~filters.Command(), instrument("chat", handle_chat))
     )
 
     # Register handlers for commands
-    application.add_handler(CommandHandler("summarize", summarize_day))
-    application.add_handler(CommandHandler("summarize_user", summarize_user))
+    application.add_handler(CommandHandler("summarize", instrument("summarize", summarize_day)))
+    application.add_handler(CommandHandler("summarize_user", instrument("summarize_user", summarize_user)))
     application.add_handler(
-        CommandHandler("golden_quote_king", summarize_golden_quote_king)
+        CommandHandler("golden_quote_king", instrument("golden_quote_king", summarize_golden_quote_king))
     )
-    application.add_handler(CommandHandler("compliment", compliment_user))
-    application.add_handler(CommandHandler("apologize", apologize))
-    application.add_handler(CommandHandler("love", send_love_quote))
-    application.add_handler(CommandHandler("countdown", countdown))
-    application.add_handler(CommandHandler("countdown_to_work", countdown_to_work))
+    application.add_handler(CommandHandler("compliment", instrument("compliment", compliment_user)))
+    application.add_handler(CommandHandler("apologize", instrument("apologize", apologize)))
+    application.add_handler(CommandHandler("love", instrument("love", send_love_quote)))
+    application.add_handler(CommandHandler("countdown", instrument("countdown", countdown)))
+    application.add_handler(CommandHandler("countdown_to_work", instrument("countdown_to_work", countdown_to_work)))
     application.add_handler(
-        CommandHandler("countdown_to_retirement", countdown_to_retirement)
+        CommandHandler("countdown_to_retirement", instrument("countdown_to_retirement", countdown_to_retirement))
     )
-    application.add_handler(CommandHandler("diu", diu))
-    application.add_handler(CommandHandler("ask", answer))
-    application.add_handler(CommandHandler("donate", donate))
+    application.add_handler(CommandHandler("diu", instrument("diu", diu)))
+    application.add_handler(CommandHandler("ask", instrument("ask", answer)))
+    application.add_handler(CommandHandler("donate", instrument("donate", donate)))
+    application.add_handler(CommandHandler("stats", instrument("stats", show_stats)))
+
+
+def build_application(request=None) -> Application:
+    """
+    Builds the bot with every handler registered. request replaces the Bot API
+    transport; the load harness in benchmarks/replay.py passes a local stub.
+    """
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        # Same pool size as the builder's default request, plus a span per Bot API call
+        .request(request or TracedRequest(connection_pool_size=256))
+        # Chats are handled in parallel, each chat's updates in order
+        .concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_MAX_PENDING))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    register_handlers(application)
+    return application
+
 
+if __name__ == "__main__":
+    # The database pool is async, so it is opened in on_startup once the event loop runs
+    application = build_application()
     print("Starting bot...")
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling()
@@ -0,0 +1,120 @@
+import asyncio
+import functools
+import time
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from config import METRICS_HOST, METRICS_PORT, logger
+from llm_scheduler import llm_scheduler
+from update_processor import ChatOrderedUpdateProcessor
+
+# Seconds between samples of the database pool gauges
+DB_POOL_SAMPLE_INTERVAL = 5
+# Seconds; covers quick commands through long streamed summaries
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+handler_duration = Histogram(
+    "bot_handler_duration_seconds", "Time spent handling one update, by command",
+    ["command", "outcome"], buckets=LATENCY_BUCKETS,
+)
+db_pool_wait = Histogram(
+    "bot_db_pool_wait_seconds", "Time spent waiting to borrow a database connection",
+    buckets=DB_BUCKETS,
+)
+db_pool_borrow = Histogram(
+    "bot_db_pool_borrow_seconds", "Time a borrowed database connection was held",
+    buckets=DB_BUCKETS,
+)
+db_query_duration = Histogram(
+    "bot_db_query_duration_seconds", "Database statement duration, by statement type",
+    ["statement"], buckets=DB_BUCKETS,
+)
+llm_call_duration = Histogram(
+    "bot_llm_call_duration_seconds", "Model call duration after admission, by command and outcome",
+    ["command", "outcome"], buckets=LATENCY_BUCKETS,
+)
+llm_queue_wait = Histogram(
+    "bot_llm_queue_wait_seconds", "Time model calls waited for a scheduler slot",
+    ["command"], buckets=LATENCY_BUCKETS,
+)
+llm_tokens = Counter(
+    "bot_llm_tokens_total", "Prompt and completion tokens used, by command",
+    ["command", "kind"],
+)
+llm_calls = Counter(
+    "bot_llm_calls_total", "Model calls, by command and outcome",
+    ["command", "outcome"],
+)
+update_queue_depth = Gauge("bot_update_queue_depth", "Updates fetched from Telegram and not yet processed")
+updates_running = Gauge("bot_updates_running", "Updates whose handlers are running")
+updates_waiting = Gauge("bot_updates_waiting", "Updates accepted and waiting for their chat's turn or a handler slot")
+llm_queue_depth = Gauge("bot_llm_queue_depth", "Model calls waiting for a scheduler slot")
+llm_in_flight = Gauge("bot_llm_in_flight", "Model calls currently running")
+db_pool_size = Gauge("bot_db_pool_size", "Database connections open in the pool")
+db_pool_available = Gauge("bot_db_pool_available", "Open database connections not lent out")
+db_pool_requests_waiting = Gauge("bot_db_pool_requests_waiting", "Callers waiting to borrow a database connection")
+db_pool_saturation = Gauge("bot_db_pool_saturation", "Share of the pool's maximum size currently lent out")
+
+
+def timed_handler(command: str, handler):
+    """Wraps an (update, context) handler so its duration lands in bot_handler_duration_seconds."""
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            result = await handler(update, context, *args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            handler_duration.labels(command, outcome).observe(time.monotonic() - started)
+    return wrapper
+
+
+def observe_llm_call(command, outcome: str, queue_seconds: float, call_seconds: float,
+                     prompt_tokens=None, completion_tokens=None) -> None:
+    command = command or "-"
+    llm_calls.labels(command, outcome).inc()
+    llm_queue_wait.labels(command).observe(queue_seconds)
+    llm_call_duration.labels(command, outcome).observe(call_seconds)
+    if prompt_tokens:
+        llm_tokens.labels(command, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        llm_tokens.labels(command, "completion").inc(completion_tokens)
+
+
+async def _sample_db_pool() -> None:
+    """
+    Copies the pool's stats into gauges from the event loop. The exporter
+    thread must not read the pool itself, as the loop changes it meanwhile.
+    """
+    # database imports this module, so it can only be imported once both are loaded
+    from database import DatabasePool
+
+    while True:
+        # The pool is opened in on_startup and closed in on_shutdown; report 0 outside that
+        stats = DatabasePool.stats() if DatabasePool.is_open() else {}
+        db_pool_size.set(stats.get("pool_size", 0))
+        db_pool_available.set(stats.get("pool_available", 0))
+        db_pool_requests_waiting.set(stats.get("requests_waiting", 0))
+        db_pool_saturation.set(stats.get("saturation", 0.0))
+        await asyncio.sleep(DB_POOL_SAMPLE_INTERVAL)
+
+
+def start_metrics_server(application) -> None:
+    """
+    Serves every metric in Prometheus text format on METRICS_HOST:METRICS_PORT.
+    Off unless METRICS_PORT is set. Gauge callbacks run on the exporter's
+    thread, so they only read plain counters.
+    """
+    if not METRICS_PORT:
+        return
+    update_queue_depth.set_function(application.update_queue.qsize)
+    processor = application.update_processor
+    if isinstance(processor, ChatOrderedUpdateProcessor):
+        updates_running.set_function(lambda: processor.running)
+        updates_waiting.set_function(lambda: processor.pending - processor.running)
+    llm_queue_depth.set_function(lambda: llm_scheduler.queued)
+    llm_in_flight.set_function(lambda: llm_scheduler.in_flight)
+    application.create_task(_sample_db_pool())
+    start_http_server(METRICS_PORT, addr=METRICS_HOST)
+    logger.info(f"Metrics served on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
@@ -0,0 +1,99 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import timedelta
+from config import GOLDEN_CANDIDATES_PER_USER, GOLDEN_MAX_CANDIDATES, GOLDEN_QUOTE_MAX_CHARS
+
+# Other speakers posting this soon after a message count as reacting to it
+RESPONSE_WINDOW = timedelta(minutes=2)
+EXPRESSIVE_PUNCTUATION = set("!?！？…~～")
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", "", text).lower()
+
+
+def _expressiveness(text: str) -> float:
+    """Share of characters that are emoji or exclamation-style punctuation."""
+    marks = sum(
+        1 for char in text
+        if char in EXPRESSIVE_PUNCTUATION or unicodedata.category(char) == "So"
+    )
+    return marks / len(text)
+
+
+def _responders(rows, index: int) -> int:
+    """Distinct other speakers who posted within RESPONSE_WINDOW after rows[index]."""
+    speaker, _, timestamp = rows[index][:3]
+    others = set()
+    for row in rows[index + 1:]:
+        if row[2] - timestamp > RESPONSE_WINDOW:
+            break
+        if row[0] != speaker:
+            others.add(row[0])
+    return len(others)
+
+
+def score_quotes(rows):
+    """
+    Scores rows of (user_name, text, timestamp), oldest first, as golden quote
+    candidates. Favours messages other people reacted to, with some substance
+    and some expression, and penalises stock phrases that many messages repeat.
+    Returns a list of (score, index) for rows worth considering.
+    """
+    repeats = Counter(_normalize(row[1]) for row in rows)
+    scored = []
+    for index, row in enumerate(rows):
+        text = row[1].strip()
+        if not text or text.startswith("/"):
+            continue
+        length = len(text)
+        score = min(length, 60) / 60
+        if length < 4:
+            score *= 0.3
+        elif length > 200:
+            # Pastes and walls of text rarely make quotable lines
+            score *= 0.6
+        score += min(_expressiveness(text) * 3, 1) * 0.5
+        score += min(_responders(rows, index), 3) * 0.5
+        score /= repeats[_normalize(text)]
+        scored.append((score, index))
+    return scored
+
+
+def select_candidates(rows):
+    """
+    Keeps the best GOLDEN_CANDIDATES_PER_USER quotes of each user, and at most
+    GOLDEN_MAX_CANDIDATES overall, each cut to GOLDEN_QUOTE_MAX_CHARS, so the
+    golden quote prompt stays bounded however chatty the day was.
+    Returns {user_name: [quote, ...]} with quotes in chronological order.
+    """
+    by_user = defaultdict(list)
+    for score, index in score_quotes(rows):
+        by_user[rows[index][0]].append((score, index))
+
+    kept = []
+    for scored in by_user.values():
+        scored.sort(reverse=True)
+        seen = set()
+        picked = []
+        for score, index in scored:
+            # Near-identical lines from the same user only need to be shown once
+            prefix = _normalize(rows[index][1])[:12]
+            if prefix in seen:
+                continue
+            seen.add(prefix)
+            picked.append((score, index))
+            if len(picked) == GOLDEN_CANDIDATES_PER_USER:
+                break
+        kept.extend(picked)
+    kept.sort(reverse=True)
+    kept = sorted(kept[:GOLDEN_MAX_CANDIDATES], key=lambda item: item[1])
+
+    candidates = {}
+    for _, index in kept:
+        text = rows[index][1].strip()
+        if len(text) > GOLDEN_QUOTE_MAX_CHARS:
+            text = text[:GOLDEN_QUOTE_MAX_CHARS] + "…"
+        candidates.setdefault(rows[index][0], []).append(text)
+    return candidates
@@ -0,0 +1,67 @@
+import asyncio
+import hashlib
+import json
+from config import logger
+
+
+def flight_key(*parts) -> str:
+    """Stable hash of a request's inputs, e.g. (model, system prompt, prompt)."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.task = None
+        self.listeners = []
+        self.text = ""
+        self.joined = 0
+
+    async def publish(self, text: str) -> None:
+        self.text = text
+        for listener in list(self.listeners):
+            try:
+                await listener(text)
+            except Exception as e:
+                logger.warning(f"Streaming listener failed: {e}")
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is running,
+    later callers with the same key await its result instead of starting
+    their own. Nothing is kept once the call finishes.
+
+    fn receives an on_delta callback (or None when the first caller does not
+    stream); streamed text is fanned out to every caller's on_delta.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.coalesced = 0
+
+    async def run(self, key, fn, on_delta=None):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            if on_delta is not None:
+                flight.listeners.append(on_delta)
+            flight.task = asyncio.ensure_future(fn(flight.publish if on_delta is not None else None))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.coalesced += 1
+            flight.joined += 1
+            logger.info(f"Joining in-flight model call {key[:12]} ({flight.joined} waiting)")
+            if on_delta is not None:
+                flight.listeners.append(on_delta)
+                if flight.text:
+                    await on_delta(flight.text)
+        try:
+            # Shielded so one caller giving up does not cancel the call for the rest
+            return await asyncio.shield(flight.task)
+        finally:
+            if on_delta in flight.listeners:
+                flight.listeners.remove(on_delta)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "coalesced": self.coalesced}
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from telegram import Update
+from telegram.ext import ContextTypes
+from config import HK_TIMEZONE, STATS_ADMIN_IDS, logger
+from database import DatabasePool, llm_call_buffer
+from db import DatabaseOperations
+from llm_scheduler import llm_scheduler
+
+STATS_DAYS = 7
+
+
+def _format_rows(rows) -> str:
+    lines = []
+    for key, calls, prompt_tokens, completion_tokens, p50, p95, failures in rows:
+        line = (
+            f"{key}: {calls} 次｜輸入 {prompt_tokens:,} + 輸出 {completion_tokens:,} tokens"
+            f"｜p50 {(p50 or 0) / 1000:.1f}s p95 {(p95 or 0) / 1000:.1f}s"
+        )
+        if failures:
+            line += f"｜失敗 {failures}"
+        lines.append(line)
+    calls = sum(row[1] for row in rows)
+    tokens = sum(row[2] + row[3] for row in rows)
+    lines.append(f"總計: {calls} 次, {tokens:,} tokens")
+    return "\n".join(lines)
+
+
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /stats: this chat's model calls over the last STATS_DAYS days, per command.
+    /stats all (STATS_ADMIN_IDS only): every chat, per command and per chat.
+    """
+    message = update.message
+    chat_id = message.chat_id
+    show_all = bool(context.args) and context.args[0] == "all"
+    if show_all and message.from_user.id not in STATS_ADMIN_IDS:
+        await message.reply_text("你冇權睇全部群組嘅用量喎！😅")
+        return
+
+    # Include calls still waiting in the write-behind buffer
+    await llm_call_buffer.flush()
+    since = datetime.now(HK_TIMEZONE) - timedelta(days=STATS_DAYS)
+    db_ops = DatabaseOperations()
+    by_command = await db_ops.get_llm_usage(since, chat_id=None if show_all else chat_id)
+    by_chat = await db_ops.get_llm_usage(since, group_by="chat", limit=10) if show_all else []
+
+    if by_command is None or by_chat is None:
+        await message.reply_text("哎呀，讀取用量時出錯！請稍後再試。")
+        return
+    if not by_command:
+        await message.reply_text(f"過去 {STATS_DAYS} 日都未用過 AI 功能喎！")
+        return
+
+    scope = "全部群組" if show_all else "呢個群組"
+    text = f"📊 {scope}過去 {STATS_DAYS} 日嘅 AI 用量\n" + _format_rows(by_command)
+    if by_chat:
+        text += "\n\n👥 用量最多嘅群組\n" + _format_rows(by_chat)
+
+    queue = llm_scheduler.stats()
+    text += f"\n\n⚙️ 而家處理緊 {queue['in_flight']} 個請求，排緊隊 {queue['queued']} 個"
+    if show_all:
+        pool = DatabasePool.stats()
+        text += (
+            f"\n🗄️ 資料庫連線: 用緊 {pool['connections_in_use']}/{pool.get('pool_size', 0)} 條"
+            f"（飽和度 {pool['saturation']:.0%}），等緊連線 {pool.get('requests_waiting', 0)} 個"
+        )
+    logger.info(f"Sent usage stats for chat {chat_id} (all chats: {show_all})")
+    await message.reply_text(text)
@@ -0,0 +1,92 @@
+import asyncio
+import time
+from telegram.error import BadRequest, RetryAfter
+from config import STREAM_EDIT_INTERVAL, logger
+
+TELEGRAM_MAX_LENGTH = 4096
+CURSOR = " ⏳"
+
+
+def split_text(text: str, limit: int = TELEGRAM_MAX_LENGTH) -> list[str]:
+    """
+    Splits text into Telegram-sized pages, preferring to cut at a newline.
+    A page boundary never moves once the text has grown past it, so pages
+    already sent stay valid while a reply is still streaming.
+    """
+    pages = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        pages.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    pages.append(text)
+    return pages
+
+
+class StreamingReply:
+    """
+    Renders a streaming AI response into a placeholder message.
+
+    update() is meant as the on_delta callback of the ai.py functions: it
+    coalesces chunks and edits the message at most once per interval, backing
+    off when Telegram answers with RetryAfter. Text longer than one message
+    continues in follow-up messages. finish() writes the final text.
+    """
+
+    def __init__(self, message, prefix: str = "", interval: float = STREAM_EDIT_INTERVAL):
+        self.messages = [message]
+        self.prefix = prefix
+        self.interval = interval
+        self._shown = [message.text]
+        self._last_edit = 0.0
+        self._blocked_until = 0.0
+
+    async def update(self, text: str) -> None:
+        now = time.monotonic()
+        if now < self._blocked_until or now - self._last_edit < self.interval:
+            return
+        self._last_edit = now
+        try:
+            await self._render(self.prefix + text, streaming=True)
+        except RetryAfter as e:
+            self._blocked_until = time.monotonic() + e.retry_after
+            logger.warning(f"Streaming edits throttled by Telegram for {e.retry_after}s")
+        except Exception as e:
+            # A failed preview must not abort the model stream; finish() will retry
+            logger.warning(f"Failed to render streaming preview: {e}")
+
+    async def finish(self, text: str):
+        """Shows the complete text and returns the last message it occupies."""
+        try:
+            await self._render(text, streaming=False)
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await self._render(text, streaming=False)
+        # Drop follow-up messages left over from a longer streamed draft
+        page_count = len(split_text(text))
+        for message in self.messages[page_count:]:
+            try:
+                await message.delete()
+            except Exception as e:
+                logger.warning(f"Failed to delete leftover streamed message: {e}")
+        del self.messages[page_count:], self._shown[page_count:]
+        return self.messages[-1]
+
+    async def _render(self, text: str, streaming: bool) -> None:
+        pages = split_text(text)
+        if streaming and len(pages[-1]) + len(CURSOR) <= TELEGRAM_MAX_LENGTH:
+            pages[-1] += CURSOR
+        for index, page in enumerate(pages):
+            if index < len(self.messages):
+                if self._shown[index] == page:
+                    continue
+                try:
+                    self.messages[index] = await self.messages[index].edit_text(page)
+                except BadRequest as e:
+                    if "not modified" not in str(e):
+                        raise
+                self._shown[index] = page
+            else:
+                self.messages.append(await self.messages[-1].chat.send_message(page))
+                self._shown.append(page)
@@ -1,9 +1,13 @@
 from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import ContextTypes
-from config import HK_TIMEZONE, logger, GOLDEN_PROMPTS, SUMMARIZE_USER_PROMPTS, AI_GENERATE_BASE_PROMPT, SUMMARIZE_PROMPTS
+from config import HK_TIMEZONE, logger, SUMMARIZE_USER_PROMPTS, AI_GENERATE_BASE_PROMPT, SUMMARIZE_PROMPTS
 from db import DatabaseOperations
 from ai import get_ai_summary
+from streaming import StreamingReply
+from llm_scheduler import llm_priority, Priority
+from transcript import compact_rows
+from summarizer import summarize_chat_range, pick_golden_quote_king, summary_cache, summary_cache_key
 
 async def check_bot_admin(chat_id, context):
     """Check if the bot is an admin in the group"""
@@ -15,6 +19,7 @@ async def check_bot_admin(chat_id, context):
         return False
     # return True 
 
+@llm_priority(Priority.NORMAL)
 async def summarize_golden_quote_king(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.message.chat_id
     logger.info(f"Starting golden quote king selection in chat {chat_id}")
@@ -28,7 +33,7 @@ async def summarize_golden_quote_king(update: Update, context: ContextTypes.DEFA
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
     db_ops = DatabaseOperations()
-    rows = db_ops.get_messages_in_range(chat_id, start_of_day, now)
+    rows = await db_ops.get_messages_in_range(chat_id, start_of_day, now)
 
     if rows is None:
         await update.message.reply_text("哎呀，讀取訊息時出錯！請稍後再試。")
@@ -39,21 +44,8 @@ async def summarize_golden_quote_king(update: Update, context: ContextTypes.DEFA
         logger.info(f"No messages found for golden quote king in chat {chat_id}")
         return
 
-    # Group messages by user
-    user_messages = {}
-    for row in rows:
-        user = row[0]
-        if user not in user_messages:
-            user_messages[user] = []
-        user_messages[user].append(row[1])
-
-    # Prepare text for AI analysis
-    analysis_text = "\n\n".join([f"{user}:\n" + "\n".join(msgs) for user, msgs in user_messages.items()])
-
-    golden_prompt = f"{";".join(GOLDEN_PROMPTS)}\n\n以下係今日嘅對話:\n{analysis_text}"
-
     waiting_message = await update.message.reply_text("搵緊今日嘅金句王… ⏳")
-    summary = get_ai_summary(golden_prompt)
+    summary = await pick_golden_quote_king(rows)
     logger.info(f"Generated golden quote king summary in chat {chat_id}: {summary}")
 
     formatted_start = start_of_day.strftime("%Y-%m-%d %H:%M")
@@ -65,6 +57,7 @@ async def summarize_golden_quote_king(update: Update, context: ContextTypes.DEFA
     else:
         await waiting_message.edit_text('系統想方加(出錯)，好對唔住')
 
+@llm_priority(Priority.NORMAL)
 async def summarize_in_range(update: Update, context: ContextTypes.DEFAULT_TYPE, start_time: datetime, end_time: datetime, period_name: str) -> None:
     chat_id = update.message.chat_id
     logger.info(f"Starting summarization for {period_name} in chat {chat_id}")
@@ -75,7 +68,7 @@ async def summarize_in_range(update: Update, context: ContextTypes.DEFAULT_TYPE,
         return
 
     db_ops = DatabaseOperations()
-    rows = db_ops.get_messages_in_range(chat_id, start_time, end_time)
+    rows = await db_ops.get_messages_in_range(chat_id, start_time, end_time)
 
     if rows is None:
         await update.message.reply_text("哎呀，讀取訊息時出錯！請稍後再試。")
@@ -86,23 +79,34 @@ async def summarize_in_range(update: Update, context: ContextTypes.DEFAULT_TYPE,
         logger.info(f"No messages found for {period_name} in chat {chat_id}")
         return
 
-    day_messages = [f"{row[0]}: {row[1]}" for row in rows]
-    text_to_summarize = "\n".join(day_messages)
+    formatted_start = start_time.astimezone(HK_TIMEZONE).strftime("%Y-%m-%d %H:%M")
+    formatted_end = end_time.astimezone(HK_TIMEZONE).strftime("%Y-%m-%d %H:%M")
+
+    # No new messages since the last identical request: answer from cache
+    cache_key = summary_cache_key(period_name, chat_id, rows)
+    summary = summary_cache.get(cache_key)
+    if summary:
+        logger.info(f"Serving cached summary for {period_name} in chat {chat_id}")
+        await update.message.reply_text(
+            f"由{formatted_start} - {formatted_end}嘅{period_name}對話總結為: 📝\n{summary}"
+        )
+        return
 
     waiting_message = await update.message.reply_text("幫緊你幫緊你… ⏳")
-    summary = get_ai_summary(f'以下為需要總結的對話:{text_to_summarize}',
-                            AI_GENERATE_BASE_PROMPT + "\n" + SUMMARIZE_PROMPTS)
+    header = f"由{formatted_start} - {formatted_end}嘅{period_name}對話總結為: 📝\n"
+    reply = StreamingReply(waiting_message, prefix=header)
+    summary = await summarize_chat_range(
+        chat_id, rows, start_time, end_time, on_delta=reply.update, bot_name=context.bot.name
+    )
     logger.info(f"Generated summary for {period_name} in chat {chat_id}: {summary}")
 
-    formatted_start = start_time.astimezone(HK_TIMEZONE).strftime("%Y-%m-%d %H:%M")
-    formatted_end = end_time.astimezone(HK_TIMEZONE).strftime("%Y-%m-%d %H:%M")
     if summary and summary != '系統想方加(出錯)，好對唔住':
-        await waiting_message.edit_text(
-            f"由{formatted_start} - {formatted_end}嘅{period_name}對話總結為: 📝\n{summary}"
-        )
+        summary_cache.set(cache_key, summary)
+        await reply.finish(header + summary)
     else:
-        await waiting_message.edit_text('系統想方加(出錯)，好對唔住')
+        await reply.finish('系統想方加(出錯)，好對唔住')
 
+@llm_priority(Priority.NORMAL)
 async def summarize_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.message.chat_id
     message = update.message
@@ -129,7 +133,7 @@ async def summarize_user(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
     db_ops = DatabaseOperations()
-    rows = db_ops.get_user_messages_in_range(chat_id, target_user_id, start_of_day, now)
+    rows = await db_ops.get_user_messages_in_range(chat_id, target_user_id, start_of_day, now)
 
     if rows is None:
         await message.reply_text("哎呀，讀取訊息時出錯！請稍後再試。")
@@ -139,17 +143,27 @@ async def summarize_user(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await message.reply_text(f"今日由00:00開始， ** {target_username} ** 無講過任何野喎！")
         return
 
-    user_messages = [f"{row[0]}: {row[1]}" for row in rows]
-    text_to_summarize = "\n".join(user_messages)
+    formatted_start = start_of_day.strftime("%Y-%m-%d %H:%M")
+    formatted_end = now.strftime("%Y-%m-%d %H:%M")
+
+    cache_key = summary_cache_key("summarize_user", chat_id, rows, target_user_id)
+    summary = summary_cache.get(cache_key)
+    if summary:
+        logger.info(f"Serving cached summary for user {target_username} in chat {chat_id}")
+        await message.reply_text(
+            f"由 {formatted_start} 到 {formatted_end}， ** {target_username} ** 講咗嘅總結: 📝\n{summary}"
+        )
+        return
+
+    text_to_summarize = compact_rows(rows, aliases=False, label=f"user {target_user_id}").text
 
     waiting_message = await message.reply_text(f"幫緊你總結 ** {target_username} ** 今日講咗啲咩… ⏳")
-    summary = get_ai_summary(f'{";".join(SUMMARIZE_USER_PROMPTS)};以下為需要總結的對話:{text_to_summarize}',
+    summary = await get_ai_summary(f'{";".join(SUMMARIZE_USER_PROMPTS)};以下為需要總結的對話:{text_to_summarize}',
                             AI_GENERATE_BASE_PROMPT + "\n" + SUMMARIZE_PROMPTS)
     logger.info(f"Generated summary for user {target_username} in chat {chat_id}: {summary}")
 
-    formatted_start = start_of_day.strftime("%Y-%m-%d %H:%M")
-    formatted_end = now.strftime("%Y-%m-%d %H:%M")
     if summary and summary != '系統想方加(出錯)，好對唔住':
+        summary_cache.set(cache_key, summary)
         await waiting_message.edit_text(
             f"由 {formatted_start} 到 {formatted_end}， ** {target_username} ** 講咗嘅總結: 📝\n{summary}"
         )
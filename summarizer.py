@@ -0,0 +1,231 @@
+import asyncio
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from config import (
+    HK_TIMEZONE,
+    logger,
+    AI_GENERATE_BASE_PROMPT,
+    SUMMARIZE_PROMPTS,
+    GOLDEN_PROMPTS,
+    PARTIAL_SUMMARY_PROMPT,
+    SUMMARY_BUCKET_MIN_MESSAGES,
+    SUMMARY_BUCKET_GRACE_MINUTES,
+    SUMMARY_MAX_PROMPT_TOKENS,
+    SUMMARY_CHUNK_TOKENS,
+    SUMMARY_MAX_PARALLEL,
+    SUMMARY_CACHE_SIZE,
+    SUMMARY_CACHE_TTL,
+)
+from ai import get_ai_summary
+from cache import TTLCache
+from chunking import estimate_tokens, split_rows, group_texts
+from database import save_hourly_summary
+from db import DatabaseOperations
+from quotes import select_candidates
+from transcript import compact_rows
+
+AI_ERROR = '系統想方加(出錯)，好對唔住'
+BUCKET = timedelta(hours=1)
+
+# Bounds how many map-step model calls run at once, across all chats
+_map_slots = asyncio.Semaphore(SUMMARY_MAX_PARALLEL)
+
+# Finished summaries, so repeated commands with no new messages skip the model
+summary_cache = TTLCache(SUMMARY_CACHE_SIZE, SUMMARY_CACHE_TTL)
+
+
+def summary_cache_key(command: str, chat_id, rows, target=None):
+    """
+    Identifies a summary request by its input. A range's rows only change when
+    messages arrive or age out, so their count and first/last timestamps act as
+    the watermark.
+    """
+    return (command, chat_id, target, len(rows), rows[0][2], rows[-1][2])
+
+
+def bucket_start(timestamp: datetime) -> datetime:
+    return timestamp.astimezone(HK_TIMEZONE).replace(minute=0, second=0, microsecond=0)
+
+
+def _speaker_counts(rows) -> str:
+    counts = Counter(row[0] for row in rows)
+    return ", ".join(f"{name} {count}" for name, count in counts.most_common())
+
+
+def _ok(summary) -> bool:
+    return bool(summary) and summary != AI_ERROR
+
+
+async def _map(user_prompt: str, system_prompt: str):
+    async with _map_slots:
+        summary = await get_ai_summary(user_prompt, system_prompt)
+    return summary if _ok(summary) else None
+
+
+async def _reduce_texts(texts, system_prompt: str = PARTIAL_SUMMARY_PROMPT):
+    """
+    Condenses partial results group by group until together they fit in
+    SUMMARY_MAX_PROMPT_TOKENS. Each round at least halves the count, so
+    the number of rounds grows only logarithmically. Returns None on failure.
+    """
+    while len(texts) > 1 and sum(estimate_tokens(text) for text in texts) > SUMMARY_MAX_PROMPT_TOKENS:
+        groups = group_texts(texts, SUMMARY_CHUNK_TOKENS)
+        if len(groups) == len(texts):
+            groups = [texts[i:i + 2] for i in range(0, len(texts), 2)]
+        texts = await asyncio.gather(*(_map("\n\n".join(group), system_prompt) for group in groups))
+        if not all(texts):
+            return None
+    return texts
+
+
+async def _map_rows(rows, system_prompt: str, bot_name: str = None):
+    """Runs system_prompt over a compacted chunk of rows. Returns "" for an empty chunk, None on failure."""
+    transcript = compact_rows(rows, bot_name=bot_name, drop_bot=True, label="summary chunk")
+    if not transcript.text:
+        return ""
+    summary = await _map(transcript.text, system_prompt)
+    return transcript.expand(summary)
+
+
+async def condense_rows(rows, system_prompt: str = PARTIAL_SUMMARY_PROMPT, bot_name: str = None):
+    """
+    Map-reduce over chat rows: splits them into token-bounded chunks on speaker
+    boundaries, runs system_prompt over every chunk concurrently and reduces the
+    results until they fit one prompt. Returns None if any model call fails,
+    and "" if there was nothing to condense.
+    """
+    chunks = split_rows(rows, SUMMARY_CHUNK_TOKENS)
+    partials = await asyncio.gather(*(_map_rows(chunk, system_prompt, bot_name) for chunk in chunks))
+    if any(partial is None for partial in partials):
+        return None
+    partials = [partial for partial in partials if partial]
+    if not partials:
+        return ""
+    if len(chunks) > 1:
+        logger.info(f"Condensed {len(rows)} messages from {len(chunks)} chunks")
+    reduced = await _reduce_texts(partials, system_prompt)
+    return "\n\n".join(reduced) if reduced else None
+
+
+async def _summarize_bucket(chat_id, start, rows, bot_name: str = None):
+    """Map step: summarizes one closed hour and stores it. Returns None on failure."""
+    summary = await condense_rows(rows, bot_name=bot_name)
+    if summary is None:
+        logger.warning(f"Partial summary failed for chat {chat_id} at {start:%Y-%m-%d %H:%M}")
+        return None
+    await save_hourly_summary(chat_id, start, len(rows), summary)
+    return summary
+
+
+async def summarize_chat_range(chat_id, rows, start_time: datetime, end_time: datetime, on_delta=None,
+                               bot_name: str = None) -> str:
+    """
+    Summarizes rows of (user_name, text, timestamp) between start_time and end_time.
+
+    Closed hours that lie fully inside the range and have enough messages are
+    summarized once and stored in hourly_summaries. Later calls reuse the
+    stored summary as long as the hour's message count is unchanged. The
+    final call then combines those partial summaries with the raw text of the
+    remaining, still-open part of the range. Raw text that would push the
+    prompt past SUMMARY_MAX_PROMPT_TOKENS is condensed by map-reduce first.
+    Raw text is compacted with transcript.compact_rows, leaving out the bot's
+    own messages (bot_name). Only the final call streams to on_delta.
+    """
+    closed_before = datetime.now(HK_TIMEZONE) - timedelta(minutes=SUMMARY_BUCKET_GRACE_MINUTES)
+    buckets = OrderedDict()
+    for row in rows:
+        buckets.setdefault(bucket_start(row[2]), []).append(row)
+
+    reusable = [
+        start for start, bucket_rows in buckets.items()
+        if start >= start_time
+        and start + BUCKET <= min(end_time, closed_before)
+        and len(bucket_rows) >= SUMMARY_BUCKET_MIN_MESSAGES
+    ]
+
+    summaries = {}
+    if reusable:
+        stored = await DatabaseOperations().get_hourly_summaries(chat_id, reusable)
+        missing = []
+        for start in reusable:
+            count, summary = stored.get(start, (None, None))
+            if count == len(buckets[start]):
+                summaries[start] = summary
+            else:
+                missing.append(start)
+        built = await asyncio.gather(
+            *(_summarize_bucket(chat_id, start, buckets[start], bot_name) for start in missing)
+        )
+        for start, summary in zip(missing, built):
+            if summary:
+                summaries[start] = summary
+        logger.info(
+            f"Chat {chat_id}: reused {len(reusable) - len(missing)} hourly summaries, "
+            f"built {sum(1 for summary in built if summary)}, {len(buckets) - len(summaries)} hour(s) sent raw"
+        )
+
+    system_prompt = AI_GENERATE_BASE_PROMPT + "\n" + SUMMARIZE_PROMPTS
+    if not summaries:
+        transcript = compact_rows(rows, bot_name=bot_name, drop_bot=True, label=f"chat {chat_id}")
+        if transcript.tokens <= SUMMARY_MAX_PROMPT_TOKENS:
+            stream = None
+            if on_delta is not None:
+                async def stream(text):
+                    await on_delta(transcript.expand(text))
+            summary = await get_ai_summary(f'以下為需要總結的對話:{transcript.text}', system_prompt, on_delta=stream)
+            return transcript.expand(summary)
+
+    # Raw hours are compacted without aliases, as they sit next to summaries that use real names
+    raw_texts = {
+        start: compact_rows(bucket_rows, bot_name=bot_name, drop_bot=True, aliases=False,
+                            label=f"chat {chat_id} {start:%H:%M}").text
+        for start, bucket_rows in buckets.items() if start not in summaries
+    }
+    raw_tokens = sum(estimate_tokens(text) for text in raw_texts.values())
+    summary_tokens = sum(estimate_tokens(summary) for summary in summaries.values())
+    if raw_tokens + summary_tokens > SUMMARY_MAX_PROMPT_TOKENS:
+        # Too much raw text left: condense the remaining hours as well (not stored,
+        # they are open or not fully inside the range)
+        raw_starts = list(raw_texts)
+        condensed = await asyncio.gather(*(condense_rows(buckets[start], bot_name=bot_name) for start in raw_starts))
+        if any(summary is None for summary in condensed):
+            return AI_ERROR
+        summaries.update(zip(raw_starts, condensed))
+
+    sections = []
+    for start, bucket_rows in buckets.items():
+        label = f"{start:%H:%M}-{start + BUCKET:%H:%M}"
+        if start in summaries:
+            if summaries[start]:
+                sections.append(f"[{label} 摘要｜發言次數: {_speaker_counts(bucket_rows)}]\n{summaries[start]}")
+        elif raw_texts[start]:
+            sections.append(f"[{label} 原文]\n{raw_texts[start]}")
+
+    sections = await _reduce_texts(sections)
+    if sections is None:
+        return AI_ERROR
+    text_to_summarize = "\n\n".join(sections)
+    return await get_ai_summary(
+        f'以下為需要總結的對話（較早時段已預先濃縮成摘要，並附上發言次數）:\n{text_to_summarize}',
+        system_prompt,
+        on_delta=on_delta,
+    )
+
+
+async def pick_golden_quote_king(rows) -> str:
+    """
+    Picks the day's golden quote king from rows of (user_name, text, timestamp).
+    Only the best-scoring candidate quotes of each user go into the prompt,
+    together with how often everyone spoke.
+    """
+    candidates = select_candidates(rows)
+    if not candidates:
+        return AI_ERROR
+    analysis_text = "\n\n".join([f"{user}:\n" + "\n".join(quotes) for user, quotes in candidates.items()])
+    logger.info(
+        f"Golden quote king: {sum(len(quotes) for quotes in candidates.values())} candidates "
+        f"from {len(rows)} messages"
+    )
+    return await get_ai_summary(
+        f"{GOLDEN_PROMPTS}\n\n今日發言次數: {_speaker_counts(rows)}\n\n以下係今日每位用戶揀出嚟嘅金句候選:\n{analysis_text}"
+    )
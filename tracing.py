@@ -0,0 +1,249 @@
+"""
+Lightweight request tracing.
+
+Every handled update runs inside start_trace(); span() blocks inside it record
+where the time went (Telegram API, database, Serper, model calls). Finished
+traces are queued and appended to TRACE_FILE, one JSON object per line, by a
+background task off the event loop. Tracing is off unless TRACE_FILE is set,
+and span() then costs next to nothing.
+
+Render the slowest traces as a waterfall with:
+    python tracing.py [--file traces.jsonl] [--slowest 10]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from telegram.request import HTTPXRequest
+from config import TRACE_FILE, TRACE_MIN_MS, logger
+
+# Seconds between trace file appends
+TRACE_FLUSH_INTERVAL = 1
+# Finished traces held while the file cannot keep up; the oldest are dropped beyond this
+TRACE_MAX_PENDING = 1000
+
+_current_trace = ContextVar("trace", default=None)
+_current_span = ContextVar("span", default=None)
+
+
+class Span:
+    __slots__ = ("id", "parent", "name", "start", "end", "attrs", "error")
+
+    def __init__(self, span_id: int, parent, name: str, attrs: dict):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.start = time.monotonic()
+        self.end = None
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+class _NoSpan:
+    """Stand-in yielded by span() outside a trace."""
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Trace:
+    def __init__(self, name: str, attrs: dict):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.wall_start = time.time()
+        self.start = time.monotonic()
+        self.spans = []
+        # Set once the trace is handed to the writer; tasks that outlive it add no more spans
+        self.finished = False
+
+    def to_dict(self, end: float) -> dict:
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "start": self.wall_start,
+            "duration_ms": round((end - self.start) * 1000, 1),
+            "attrs": dict(self.attrs),
+            "spans": [
+                {
+                    "id": span.id,
+                    "parent": span.parent,
+                    "name": span.name,
+                    "offset_ms": round((span.start - self.start) * 1000, 1),
+                    "duration_ms": round(((span.end or end) - span.start) * 1000, 1),
+                    "attrs": dict(span.attrs),
+                    "error": span.error,
+                }
+                for span in self.spans
+            ],
+        }
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """Runs the block as one trace; written to TRACE_FILE if it took at least TRACE_MIN_MS."""
+    if not TRACE_FILE:
+        yield None
+        return
+    trace = Trace(name, attrs)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        trace.finished = True
+        end = time.monotonic()
+        if (end - trace.start) * 1000 >= TRACE_MIN_MS:
+            trace_writer.add(trace.to_dict(end))
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times the block as a child of the current span. Does nothing outside a trace."""
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        yield _NO_SPAN
+        return
+    current = Span(len(trace.spans), _current_span.get(), name, attrs)
+    trace.spans.append(current)
+    token = _current_span.set(current.id)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.end = time.monotonic()
+        _current_span.reset(token)
+
+
+class TracedRequest(HTTPXRequest):
+    """Bot API transport that records every Telegram call as a span of the current trace."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        if "/file/bot" in url:
+            name = "telegram.download"
+        else:
+            name = f"telegram.{url.rsplit('/', 1)[-1]}"
+        with span(name):
+            return await super().do_request(url, method, *args, **kwargs)
+
+
+def trace_update(command: str, handler):
+    """Wraps an (update, context) handler so each update it handles becomes one trace."""
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        chat = update.effective_chat
+        with start_trace(command, update_id=update.update_id, chat_id=chat.id if chat else None):
+            return await handler(update, context, *args, **kwargs)
+    return wrapper
+
+
+class TraceWriter:
+    """Queues finished traces and appends them to TRACE_FILE from a worker thread."""
+
+    def __init__(self, flush_interval=TRACE_FLUSH_INTERVAL, max_pending=TRACE_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._task = None
+
+    def add(self, record: dict) -> None:
+        self._pending.append(record)
+        if len(self._pending) > self.max_pending:
+            dropped = len(self._pending) - self.max_pending
+            del self._pending[:dropped]
+            logger.error(f"Trace queue full: dropped {dropped} oldest trace(s)")
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        records, self._pending = self._pending, []
+        await asyncio.to_thread(_write, records)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Trace writer failed: {e}")
+
+    def start(self):
+        if TRACE_FILE and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Tracing to {TRACE_FILE} (updates taking at least {TRACE_MIN_MS} ms)")
+
+    async def stop(self):
+        """Stops the periodic writes and appends whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+def _write(records: list) -> None:
+    try:
+        with open(TRACE_FILE, "a", encoding="utf-8") as sink:
+            sink.writelines(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+    except OSError as e:
+        logger.error(f"Failed to write {len(records)} trace(s): {e}")
+
+
+trace_writer = TraceWriter()
+
+
+def render_waterfall(record: dict, width: int = 50) -> str:
+    """Draws one trace as an indented span tree with bars on a shared time axis."""
+    total = record["duration_ms"] or 1
+    children = {}
+    for item in record["spans"]:
+        children.setdefault(item["parent"], []).append(item)
+
+    lines = [f"{record['name']}  {record['duration_ms']:.0f} ms  trace {record['trace_id']}  {record['attrs']}"]
+
+    def walk(parent, depth):
+        for item in sorted(children.get(parent, []), key=lambda s: s["offset_ms"]):
+            start = int(item["offset_ms"] / total * width)
+            length = max(1, int(item["duration_ms"] / total * width))
+            bar = " " * start + "█" * min(length, width - start)
+            label = ("  " * depth + item["name"])[:32]
+            error = f"  !{item['error']}" if item["error"] else ""
+            lines.append(f"  {label:<32} |{bar:<{width}}| {item['duration_ms']:>8.0f} ms{error}")
+            walk(item["id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the slowest recorded traces as waterfalls.")
+    parser.add_argument("--file", default=TRACE_FILE or "traces.jsonl", help="JSONL trace file")
+    parser.add_argument("--slowest", type=int, default=10, help="number of traces to show")
+    parser.add_argument("--name", help="only traces of this command")
+    args = parser.parse_args()
+
+    with open(args.file, encoding="utf-8") as source:
+        records = [json.loads(line) for line in source if line.strip()]
+    if args.name:
+        records = [record for record in records if record["name"] == args.name]
+    records.sort(key=lambda record: record["duration_ms"], reverse=True)
+    for record in records[:args.slowest]:
+        print(render_waterfall(record))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import re
+from collections import Counter
+from config import COMPACT_ALIAS_MIN_CHARS, COMPACT_BOT_MAX_CHARS, COMPACT_URL_MAX_CHARS, logger
+from chunking import estimate_tokens
+
+URL_PATTERN = re.compile(r"https?://(?:www\.)?([^/\s]+)\S*")
+# Aliases are bracketed so that chat text such as "U2 concert" can never be mistaken for one
+ALIAS_FORMAT = "〔U{}〕"
+ALIAS_PATTERN = re.compile(r"〔U\d+〕")
+# Repeats of messages at least this long from the same speaker are copy-paste, not chat
+DUPLICATE_MIN_CHARS = 10
+
+
+def _shorten_urls(text: str) -> str:
+    def shorten(match):
+        url = match.group(0)
+        return url if len(url) <= COMPACT_URL_MAX_CHARS else f"{match.group(1)}/…"
+    return URL_PATTERN.sub(shorten, text)
+
+
+class Transcript:
+    """A compacted chat transcript plus what is needed to read the model's answer back."""
+
+    def __init__(self, text: str, aliases: dict, raw_tokens: int):
+        self.text = text
+        self.aliases = aliases  # alias -> user name
+        self.raw_tokens = raw_tokens
+        self.tokens = estimate_tokens(text)
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.raw_tokens - self.tokens
+
+    def expand(self, text):
+        """Puts real user names back where the model wrote an alias this transcript assigned."""
+        if not self.aliases or not text:
+            return text
+        return ALIAS_PATTERN.sub(lambda match: self.aliases.get(match.group(0), match.group(0)), text)
+
+
+def compact_rows(rows, bot_name: str = None, drop_bot: bool = False, aliases: bool = True,
+                 label: str = "transcript") -> Transcript:
+    """
+    Formats rows of (user_name, text, ...) for a prompt in fewer tokens than
+    one "user_name: text" line per message:
+    - consecutive messages from one speaker share one line, separated by " / "
+    - repeated messages in a row become "text ×N"; copy-pasted repeats are dropped
+    - long links are cut to their domain
+    - rows from bot_name are dropped, or cut to COMPACT_BOT_MAX_CHARS
+    - with aliases, long names that start several lines become 〔U1〕, 〔U2〕, ... with a
+      legend on top; Transcript.expand() maps them back in the model's answer
+    """
+    raw_tokens = estimate_tokens("\n".join(f"{row[0]}: {row[1]}" for row in rows))
+
+    turns = []  # [speaker, [[text, repeats], ...]]
+    seen = set()
+    for row in rows:
+        speaker, text = row[0], " ".join(row[1].split())
+        if not text:
+            continue
+        if bot_name and speaker == bot_name:
+            if drop_bot:
+                continue
+            if len(text) > COMPACT_BOT_MAX_CHARS:
+                text = text[:COMPACT_BOT_MAX_CHARS] + "…"
+        text = _shorten_urls(text)
+
+        if turns and turns[-1][0] == speaker:
+            messages = turns[-1][1]
+            if messages[-1][0] == text:
+                messages[-1][1] += 1
+                continue
+        if len(text) >= DUPLICATE_MIN_CHARS:
+            if (speaker, text) in seen:
+                continue
+            seen.add((speaker, text))
+        if turns and turns[-1][0] == speaker:
+            turns[-1][1].append([text, 1])
+        else:
+            turns.append([speaker, [[text, 1]]])
+
+    names = {}
+    if aliases:
+        turn_counts = Counter(speaker for speaker, _ in turns)
+        for speaker, count in turn_counts.items():
+            if count > 1 and len(speaker) >= COMPACT_ALIAS_MIN_CHARS:
+                names[speaker] = ALIAS_FORMAT.format(len(names) + 1)
+
+    lines = []
+    if names:
+        lines.append("（用戶代號: " + ", ".join(f"{alias}={speaker}" for speaker, alias in names.items()) + "）")
+    for speaker, messages in turns:
+        said = " / ".join(text if repeats == 1 else f"{text} ×{repeats}" for text, repeats in messages)
+        lines.append(f"{names.get(speaker, speaker)}: {said}")
+
+    transcript = Transcript("\n".join(lines), {alias: speaker for speaker, alias in names.items()}, raw_tokens)
+    logger.info(
+        f"Compacted {label}: {len(rows)} messages, {raw_tokens} -> {transcript.tokens} tokens "
+        f"(saved {transcript.saved_tokens})"
+    )
+    return transcript
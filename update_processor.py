@@ -0,0 +1,82 @@
+import asyncio
+from collections import Counter
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import logger
+
+
+def _chat_id(update):
+    if isinstance(update, Update) and update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates from different chats concurrently while keeping each
+    chat's updates in the order they arrived.
+
+    An update first waits for the previous update of its chat to finish, then
+    for one of max_running handler slots. Updates waiting for their chat's turn
+    hold no handler slot, so a slow /summarize only delays its own chat.
+    max_pending bounds how many updates are accepted at once, including the
+    ones waiting for their turn. Updates without a chat run unordered.
+    """
+
+    def __init__(self, max_running: int, max_pending: int):
+        # The base class semaphore admits max_pending updates; handler slots are ours
+        super().__init__(max(max_pending, max_running))
+        self.max_running = max_running
+        self._running = asyncio.Semaphore(max_running)
+        self._chat_locks = {}
+        self._chat_waiting = Counter()
+        self.pending = 0
+        self.running = 0
+
+    async def do_process_update(self, update, coroutine) -> None:
+        self.pending += 1
+        try:
+            await self._process(_chat_id(update), coroutine)
+        finally:
+            self.pending -= 1
+
+    async def _process(self, chat_id, coroutine) -> None:
+        if chat_id is None:
+            await self._run(coroutine)
+            return
+
+        # asyncio.Lock wakes waiters first come, first served, so arrival order is kept
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_waiting[chat_id] += 1
+        try:
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            self._chat_waiting[chat_id] -= 1
+            if not self._chat_waiting[chat_id]:
+                del self._chat_waiting[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def _run(self, coroutine) -> None:
+        async with self._running:
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+
+    async def initialize(self) -> None:
+        logger.info(
+            f"Processing updates concurrently: {self.max_running} at once, "
+            f"up to {self.max_concurrent_updates} accepted, in order per chat"
+        )
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "waiting": self.pending - self.running,
+            "busy_chats": len(self._chat_waiting),
+        }
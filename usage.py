@@ -0,0 +1,71 @@
+import asyncio
+import time
+from datetime import datetime
+from openai import APITimeoutError
+from config import HK_TIMEZONE
+from chunking import estimate_tokens
+from database import llm_call_buffer
+from llm_scheduler import LLMOverloaded, current_request
+from metrics import observe_llm_call
+
+
+def _outcome(error: BaseException) -> str:
+    if isinstance(error, LLMOverloaded):
+        return "shed"
+    if isinstance(error, (APITimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    return "error"
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """Rough prompt size for calls whose response carries no usage (streams)."""
+    total = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        elif isinstance(content, list):
+            total += sum(estimate_tokens(part.get("text", "")) for part in content if isinstance(part, dict))
+    return total
+
+
+class LLMCall:
+    """
+    Times one model call and records it to llm_calls through llm_call_buffer
+    and to the Prometheus metrics.
+    Command and chat come from the handler's llm_request context.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.created_at = datetime.now(HK_TIMEZONE)
+        self.started = time.monotonic()
+        self.admitted_at = None
+        self.recorded = False
+
+    def admitted(self):
+        """Marks the end of the scheduler queue wait and the start of the call itself."""
+        self.admitted_at = time.monotonic()
+
+    @property
+    def queue_ms(self) -> int:
+        return int(((self.admitted_at or time.monotonic()) - self.started) * 1000)
+
+    def finish(self, prompt_tokens=None, completion_tokens=None, estimated: bool = False, outcome: str = "ok"):
+        if self.recorded:
+            return
+        self.recorded = True
+        now = time.monotonic()
+        admitted_at = self.admitted_at or now
+        _, chat_id, command = current_request()
+        queue_seconds, call_seconds = admitted_at - self.started, now - admitted_at
+        llm_call_buffer.add(
+            self.created_at, command, chat_id, self.model, prompt_tokens, completion_tokens,
+            estimated, int(queue_seconds * 1000), int(call_seconds * 1000), outcome,
+        )
+        observe_llm_call(command, outcome, queue_seconds, call_seconds, prompt_tokens, completion_tokens)
+
+    def fail(self, error: BaseException):
+        self.finish(outcome=_outcome(error))
@@ -0,0 +1,108 @@
+import asyncio
+import hmac
+import signal
+from aiohttp import web
+from telegram import Update
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_MAX_CONNECTIONS,
+    logger,
+)
+from update_processor import ChatOrderedUpdateProcessor
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Seconds to keep handling already accepted updates on shutdown; Telegram will not resend them
+DRAIN_TIMEOUT = 30
+
+
+def build_web_app(application) -> web.Application:
+    """
+    POST WEBHOOK_PATH takes updates pushed by Telegram. GET /healthz reports
+    whether this process is up and how much work it has queued.
+    """
+
+    async def receive_update(request: web.Request) -> web.Response:
+        # Only Telegram knows the secret given to setWebhook. Compared as bytes: compare_digest
+        # rejects non-ASCII str, and aiohttp keeps undecodable header bytes as surrogates
+        token = request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+        if not hmac.compare_digest(token, WEBHOOK_SECRET.encode()):
+            logger.warning(f"Rejected webhook request from {request.remote}: bad secret token")
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            if not isinstance(data, dict) or "update_id" not in data:
+                raise ValueError("not an Update object")
+            update = Update.de_json(data, application.bot)
+        except Exception as e:
+            logger.warning(f"Rejected malformed webhook update from {request.remote}: {e}")
+            return web.Response(status=400)
+        # Answer straight away; the update is handled in the background like a polled one
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        status = {"status": "ok" if application.running else "starting", "update_queue": application.update_queue.qsize()}
+        processor = application.update_processor
+        if isinstance(processor, ChatOrderedUpdateProcessor):
+            status.update(processor.stats())
+        return web.json_response(status, status=200 if application.running else 503)
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, receive_update)
+    app.router.add_get("/healthz", health)
+    return app
+
+
+async def run_webhook(application) -> None:
+    """
+    Serves the bot over a webhook until SIGINT/SIGTERM. Mirrors run_polling's
+    lifecycle, so on_startup and on_shutdown run the same way.
+    """
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError("BOT_MODE=webhook needs WEBHOOK_URL and WEBHOOK_SECRET")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    # No access log: every update is logged by its handler, and health checks would flood it
+    runner = web.AppRunner(build_web_app(application), access_log=None)
+    try:
+        # Inside the try, so a failed startup still closes what on_startup opened
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+        # Every instance behind the load balancer registers the same URL, so this is idempotent
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info(f"Webhook listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        await stop.wait()
+    finally:
+        # The webhook stays registered: other instances may still be serving it
+        await runner.cleanup()
+        if application.running:
+            try:
+                await asyncio.wait_for(application.update_queue.join(), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error(f"{application.update_queue.qsize()} accepted update(s) dropped on shutdown")
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)